@@ -0,0 +1,472 @@
+import os
+import json
+import time
+import asyncio
+import threading
+from collections import deque
+import aiohttp
+from http_session import get_session, POOL_MAXSIZE
+from uplink_encoder import DEFAULT_UPLINK_CODECS, UNSUPPORTED_CODEC_STATUSES, encode_upload
+from image_preprocess import DEFAULT_IMAGE_PROFILES, preprocess_image
+from live_upload import LiveAudioUpload
+from request_policy import DEFAULT_POLICIES, get_policy, get_resilience_stats, call_async, check_status
+import latency_trace
+
+DEFAULT_BASE_URL = "http://192.168.100.160:3100"
+DEFAULT_BOOK_ID = "1735953778384-Atomic habits ( PDFDrive ) shorter.pdf"
+
+class TransferStats:
+    """Size and timing of one audio query"""
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.status = None
+        self.started = time.perf_counter()
+        # Live uploads only: when the recording ended and the last chunk was
+        # written. A complete body is written into local socket buffers long
+        # before it reaches the server, so other uploads have no upload end.
+        self.upload_time = None
+        self.headers_time = None
+        self.first_byte_time = None
+        self.total_time = None
+
+    def as_dict(self):
+        return {
+            "endpoint": self.endpoint,
+            "status": self.status,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "upload_time": self.upload_time,
+            "headers_time": self.headers_time,
+            "ttfb": self.first_byte_time,
+            "total_time": self.total_time,
+        }
+
+    def __str__(self):
+        ttfb = f"{self.first_byte_time:.2f} s" if self.first_byte_time is not None else "n/a"
+        total = f"{self.total_time:.2f} s" if self.total_time is not None else "n/a"
+        upload = f", live body done {self.upload_time:.2f} s" if self.upload_time is not None else ""
+        return (f"{self.endpoint}: sent {self.bytes_sent / 1024:.1f} KB{upload}, "
+                f"received {self.bytes_received / 1024:.1f} KB, first byte {ttfb}, total {total}")
+
+class AsyncAPIClient:
+    """
+    asyncio client for every RAG reader server endpoint
+
+    All requests share one aiohttp connection pool and at most
+    max_concurrency of them are in flight at once. Every call is a
+    coroutine, so it can be awaited, gathered with others or cancelled.
+    The blocking client classes run these coroutines on an EventLoopThread.
+    """
+    def __init__(self, base_url=DEFAULT_BASE_URL, max_concurrency=4, limit_per_host=POOL_MAXSIZE,
+                 temp_dir="temp_files", stats=None, chunk_size=16 * 1024, uplink_codecs=None,
+                 image_profiles=None, policies=None, resilience=None, log_transfers=True):
+        """
+        Args:
+            base_url: Server address
+            max_concurrency: Maximum number of requests in flight
+            limit_per_host: Maximum number of open connections per host
+            temp_dir: Directory receiving response audio
+            stats: PoolStats receiving request/connection counters, the shared one if None
+            chunk_size: Largest response chunk held in memory while streaming
+            uplink_codecs: Mapping of endpoint to query audio codec, DEFAULT_UPLINK_CODECS if None
+            image_profiles: Mapping of endpoint to ImageProfile, DEFAULT_IMAGE_PROFILES if None
+            policies: Mapping of endpoint to RequestPolicy overriding DEFAULT_POLICIES
+            resilience: ResilienceStats receiving timeout/retry/hedge counters, the shared one if None
+            log_transfers: Print the TransferStats of every audio query
+        """
+        self.base_url = base_url
+        self.max_concurrency = max_concurrency
+        self.limit_per_host = limit_per_host
+        self.temp_dir = temp_dir
+        self.pool_stats = stats if stats is not None else get_session().pool_stats
+        self.chunk_size = chunk_size
+        self.uplink_codecs = dict(DEFAULT_UPLINK_CODECS if uplink_codecs is None else uplink_codecs)
+        self.image_profiles = dict(DEFAULT_IMAGE_PROFILES if image_profiles is None else image_profiles)
+        self.policies = dict(DEFAULT_POLICIES, **(policies or {}))
+        self.resilience = resilience if resilience is not None else get_resilience_stats()
+        self.log_transfers = log_transfers
+        # None until the first batch call tells us whether /next-sentences exists
+        self.batch_supported = None
+        # TransferStats of recent audio queries, newest last
+        self.transfers = deque(maxlen=100)
+
+        self._session = None
+        self._semaphore = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def close(self):
+        """Close the connection pool"""
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _get_session(self):
+        if self._session is None or self._session.closed:
+            trace = aiohttp.TraceConfig()
+            trace.on_request_start.append(self._on_request_start)
+            trace.on_connection_create_end.append(self._on_connection_create_end)
+            connector = aiohttp.TCPConnector(limit=self.max_concurrency,
+                                             limit_per_host=self.limit_per_host)
+            self._session = aiohttp.ClientSession(connector=connector, trace_configs=[trace])
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        return self._session
+
+    async def _on_request_start(self, session, context, params):
+        self.pool_stats.count_request()
+
+    async def _on_connection_create_end(self, session, context, params):
+        self.pool_stats.count_connection()
+
+    async def _call(self, endpoint, attempt, hedge=True, can_retry=None):
+        """Run attempt under the endpoint's deadlines, retries and hedging"""
+        return await call_async(endpoint, get_policy(endpoint, self.policies), attempt,
+                                self.resilience, hedge, can_retry)
+
+    async def get_next_sentence(self, book_id=DEFAULT_BOOK_ID):
+        """
+        Returns:
+            str: URL of the next sentence's audio, or None if the request fails
+        """
+        session = await self._get_session()
+        timeout = get_policy("/next-sentence", self.policies).client_timeout()
+
+        async def attempt():
+            async with self._semaphore:
+                async with session.post(f"{self.base_url}/next-sentence",
+                                        params={'book_id': book_id}, timeout=timeout) as response:
+                    if response.status == 200:
+                        return json.loads(await response.text())
+                    check_status(response.status)
+                    print(f"API call failed: {response.status}")
+                    return None
+
+        try:
+            return await self._call("/next-sentence", attempt)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error occurred: {e}")
+            return None
+
+    async def download(self, audio_url):
+        """
+        Download a sentence clip into memory under the "audio" policy
+        Returns:
+            bytes: The clip, or None if the download fails
+        """
+        session = await self._get_session()
+        timeout = get_policy("audio", self.policies).client_timeout()
+
+        async def attempt():
+            async with self._semaphore:
+                async with session.get(audio_url, timeout=timeout) as response:
+                    if response.status == 200:
+                        return await response.read()
+                    check_status(response.status)
+                    print(f"Failed to download audio: {response.status}")
+                    return None
+
+        try:
+            return await self._call("audio", attempt)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Error downloading audio: {e}")
+            return None
+
+    async def get_next_sentences(self, count, book_id=DEFAULT_BOOK_ID):
+        """
+        Resolve the next count sentence URLs in one round trip
+
+        Falls back to back-to-back /next-sentence calls on the kept-alive
+        pool when the server has no /next-sentences endpoint.
+        Args:
+            count: Number of sentences to resolve
+            book_id: Book to read from
+        Returns:
+            list: Audio URLs in reading order, empty at the end of the book,
+                or None if the request failed
+        """
+        session = await self._get_session()
+        if self.batch_supported is not False:
+            timeout = get_policy("/next-sentences", self.policies).client_timeout()
+
+            async def attempt():
+                async with self._semaphore:
+                    async with session.post(f"{self.base_url}/next-sentences",
+                                            params={'book_id': book_id, 'count': count},
+                                            timeout=timeout) as response:
+                        if response.status == 200:
+                            self.batch_supported = True
+                            return json.loads(await response.text())
+                        elif response.status in (404, 405, 501):
+                            print("Batch endpoint not available, using single sentence calls")
+                            self.batch_supported = False
+                            return None
+                        check_status(response.status)
+                        print(f"API call failed: {response.status}")
+                        return None
+
+            try:
+                urls = await self._call("/next-sentences", attempt)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print(f"Error occurred: {e}")
+                return None
+            if self.batch_supported is not False:
+                return urls
+
+        # The server keeps the reading position, so single calls must stay in order
+        urls = []
+        for _ in range(count):
+            audio_url = await self.get_next_sentence(book_id)
+            if audio_url is None:
+                return urls or None
+            if not audio_url:
+                break
+            urls.append(audio_url)
+        return urls
+
+    async def send_voice_query(self, audio_file, sink=None):
+        """
+        Send voice query to RAG Voice Assistant API
+        Args:
+            audio_file: Path to the audio file, WAV bytes or a file object, or a
+                LiveAudioUpload still being recorded
+            sink: Optional callable receiving each response chunk as it arrives
+        Returns:
+            str: Path to response audio file, or None if request fails
+        """
+        if _missing(audio_file):
+            print(f"Audio file not found: {audio_file}")
+            return None
+        return await self._post_audio_query("/rag-voice-assistant", "response.wav",
+                                            'file', audio_file, sink=sink)
+
+    async def send_ocr_query(self, image_file, audio_file, sink=None):
+        """
+        Send image and audio to OCR Image and Audio API
+        Returns:
+            str: Path to response audio file, or None if request fails
+        """
+        if _missing(image_file) or _missing(audio_file):
+            print("Image or audio file not found")
+            return None
+        return await self._post_audio_query("/process-ocr-image-and-audio", "ocr_response.wav",
+                                            'audio', audio_file, image_file, sink)
+
+    async def process_vision_query(self, image_file, audio_file, sink=None):
+        """
+        Send image and audio to process-text-and-image API
+        Returns:
+            str: Path to response audio file, or None if request fails
+        """
+        if _missing(image_file) or _missing(audio_file):
+            print("Image or audio file not found")
+            return None
+        return await self._post_audio_query("/process-text-and-image", "vision_response.wav",
+                                            'audio', audio_file, image_file, sink)
+
+    def _build_parts(self, endpoint, audio_field, audio_file, image_file=None):
+        """
+        Read and encode the upload parts (runs in a worker thread)
+        Returns:
+            list: (field name, upload file name, bytes or async iterator, content type) tuples
+        """
+        parts = []
+        if image_file is not None:
+            image_bytes = read_source(image_file)
+            image_bytes = preprocess_image(image_bytes, self.image_profiles.get(endpoint),
+                                           log=self.log_transfers)
+            parts.append(('image', 'image.jpg', image_bytes, 'image/jpeg'))
+
+        if isinstance(audio_file, LiveAudioUpload):
+            # Streamed as recorded, so it cannot be compressed as a whole file
+            parts.append((audio_field, 'query.wav', audio_file.body(), 'audio/wav'))
+            return parts
+
+        wav_bytes = read_source(audio_file)
+        codec = self.uplink_codecs.get(endpoint, "wav")
+        audio_bytes, encoder = encode_upload(wav_bytes, codec)
+        parts.append((audio_field, 'query' + encoder.extension, audio_bytes, encoder.content_type))
+        return parts
+
+    async def _post_audio_query(self, endpoint, response_name, audio_field, audio_file,
+                                image_file=None, sink=None):
+        """
+        Upload the query audio (and image) and stream the response audio to temp_dir
+        Args:
+            endpoint: Server path
+            response_name: File name for the response audio
+            audio_field: Multipart field name of the query audio
+            audio_file: Recorded WAV query (path, bytes or file object), or a LiveAudioUpload
+            image_file: Optional JPEG (path, bytes or file object) sent as the 'image' field
+            sink: Optional callable receiving each response chunk as it arrives,
+                e.g. StreamingAudioBuffer.append for playback during the download
+        Returns:
+            str: Path to response audio file, or None if request fails
+        """
+        session = await self._get_session()
+        transfer = TransferStats(endpoint)
+        timeout = get_policy(endpoint, self.policies).client_timeout()
+        live = isinstance(audio_file, LiveAudioUpload)
+        # Set when the server turns down compressed query audio
+        rejected = []
+
+        async def attempt():
+            # A form can only be sent once, so every attempt builds its own
+            form = aiohttp.FormData()
+            for name, filename, data, content_type in parts:
+                form.add_field(name, data, filename=filename, content_type=content_type)
+
+            async with self._semaphore:
+                transfer.started = time.perf_counter()
+                async with session.post(f"{self.base_url}{endpoint}", data=form, timeout=timeout,
+                                        trace_request_ctx=transfer) as response:
+                    if live:
+                        transfer.bytes_sent += audio_file.bytes_sent
+                        if audio_file.finished_time is not None:
+                            transfer.upload_time = audio_file.finished_time - transfer.started
+                    transfer.status = response.status
+                    transfer.headers_time = time.perf_counter() - transfer.started
+                    if response.status != 200:
+                        print(f"Error: {response.status}")
+                        print(f"Response: {await response.text()}")
+                        if (response.status in UNSUPPORTED_CODEC_STATUSES
+                                and parts[-1][3] != 'audio/wav'):
+                            rejected.append(response.status)
+                        check_status(response.status)
+                        return None
+                    os.makedirs(self.temp_dir, exist_ok=True)
+                    response_path = os.path.join(self.temp_dir, response_name)
+                    # Only one chunk is held in memory; it goes to disk and the sink
+                    with open(response_path, 'wb') as out:
+                        async for chunk in response.content.iter_chunked(self.chunk_size):
+                            if transfer.first_byte_time is None:
+                                transfer.first_byte_time = time.perf_counter() - transfer.started
+                            transfer.bytes_received += len(chunk)
+                            out.write(chunk)
+                            if sink:
+                                sink(chunk)
+                    return response_path
+
+        try:
+            while True:
+                parts = await asyncio.to_thread(self._build_parts, endpoint, audio_field,
+                                                audio_file, image_file)
+                transfer.bytes_sent = sum(len(data) for _, _, data, _ in parts
+                                          if isinstance(data, bytes))
+                # A live recording cannot be replayed, and a half-played answer must not repeat
+                response_path = await self._call(endpoint, attempt, hedge=False,
+                                                 can_retry=lambda: not live and transfer.bytes_received == 0)
+                if response_path or not rejected:
+                    break
+                # The audio part is WAV from now on, so this loops at most once more
+                print(f"Server rejected {parts[-1][1]}, sending WAV to {endpoint} from now on")
+                self.uplink_codecs[endpoint] = "wav"
+                rejected.clear()
+            return response_path
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"API request failed: {str(e)}")
+            return None
+        finally:
+            transfer.total_time = time.perf_counter() - transfer.started
+            if live:
+                audio_file.bytes_received = transfer.bytes_received
+            self.transfers.append(transfer)
+            if self.log_transfers:
+                print(transfer)
+            _trace_transfer(transfer)
+
+def _trace_transfer(transfer):
+    """
+    Split a finished query into upload, server and download spans
+    Only a live upload knows when its body ended; for other uploads the
+    time until the response headers is one upload_and_server span.
+    """
+    if not latency_trace.enabled() or transfer.headers_time is None:
+        return
+    if transfer.upload_time is not None:
+        stages = (("upload", 0.0, transfer.upload_time),
+                  ("server", transfer.upload_time, transfer.headers_time))
+    else:
+        stages = (("upload_and_server", 0.0, transfer.headers_time),)
+    stages += (("download", transfer.headers_time, transfer.total_time),)
+    for name, begin, end in stages:
+        latency_trace.record(name, transfer.started + begin, max(0.0, end - begin),
+                             endpoint=transfer.endpoint)
+
+def _missing(source):
+    """True if source is a file path that does not exist"""
+    if not isinstance(source, (str, os.PathLike)):
+        return False
+    return not os.path.exists(source)
+
+def read_source(source):
+    """
+    Read an upload held in memory or on disk
+    Args:
+        source: File path, bytes-like buffer or binary file object
+    Returns:
+        bytes: Its contents
+    """
+    if isinstance(source, bytes):
+        return source
+    if isinstance(source, (bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, 'read'):
+        # The parts are built again when a rejected codec is re-sent as WAV,
+        # so start from the top
+        if hasattr(source, 'seek') and source.seekable():
+            source.seek(0)
+        return source.read()
+    with open(source, 'rb') as f:
+        return f.read()
+
+class EventLoopThread:
+    """Background thread running the asyncio loop behind the blocking clients"""
+    def __init__(self):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="asyncio-loop",
+                                        daemon=True)
+        self._thread.start()
+
+    def submit(self, coro):
+        """
+        Schedule coro without waiting for it
+        Returns:
+            concurrent.futures.Future: Result handle; cancel() cancels the coroutine
+        """
+        return asyncio.run_coroutine_threadsafe(latency_trace.bind(coro), self.loop)
+
+    def run(self, coro, timeout=None):
+        """Run coro on the loop and block until it finishes"""
+        future = self.submit(coro)
+        try:
+            return future.result(timeout)
+        except BaseException:
+            future.cancel()
+            raise
+
+_loop_thread = None
+_loop_lock = threading.Lock()
+
+def get_event_loop_thread():
+    """
+    Return the process-wide event loop thread, starting it on first use
+    """
+    global _loop_thread
+    with _loop_lock:
+        if _loop_thread is None:
+            _loop_thread = EventLoopThread()
+        return _loop_thread
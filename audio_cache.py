@@ -0,0 +1,268 @@
+import os
+import json
+import time
+import hashlib
+import threading
+from http_session import get_session
+from request_policy import get_policy, get_resilience_stats, call_sync, check_status
+from urllib.parse import unquote
+
+class AudioCache:
+    """
+    Size-bounded on-disk cache for downloaded sentence audio
+
+    Entries are keyed by URL and point at content-addressed blobs (named by
+    the SHA-256 of the audio), so identical clips served under different URLs
+    are stored once. The least recently used entries are evicted when the
+    blobs exceed max_bytes. Entries older than revalidate_after seconds are
+    revalidated with If-None-Match / If-Modified-Since before reuse.
+    Downloads follow the "audio" RequestPolicy: timeouts, retries and a
+    hedged second request when the first one is slow.
+    """
+    def __init__(self, cache_dir=os.path.join("audio", "cache"), max_bytes=64 * 1024 * 1024,
+                 revalidate_after=24 * 3600, session=None, policy=None, resilience=None):
+        """
+        Args:
+            cache_dir: Directory holding the index and audio blobs
+            max_bytes: Maximum total size of cached audio
+            revalidate_after: Seconds an entry is served without asking the server
+            session: requests.Session to download with, the shared pooled one if None
+            policy: RequestPolicy for downloads, the "audio" default if None
+            resilience: ResilienceStats receiving retry/hedge counters, the shared one if None
+        """
+        self.cache_dir = cache_dir
+        self.blob_dir = os.path.join(cache_dir, "blobs")
+        self.index_path = os.path.join(cache_dir, "index.json")
+        self.max_bytes = max_bytes
+        self.revalidate_after = revalidate_after
+        self.session = session if session is not None else get_session()
+        self.policy = policy if policy is not None else get_policy("audio")
+        self.resilience = resilience if resilience is not None else get_resilience_stats()
+        os.makedirs(self.blob_dir, exist_ok=True)
+
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.bytes_downloaded = 0
+
+        self._lock = threading.Lock()
+        self._entries = self._load_index()
+
+    def fetch(self, audio_url, cancel_event=None):
+        """
+        Return a local copy of audio_url, downloading only when needed
+        Args:
+            audio_url: URL of the audio file
+            cancel_event: Optional threading.Event that aborts the download when set
+        Returns:
+            str: Path to the cached file, or None if the download fails
+        """
+        with self._lock:
+            entry = self._entries.get(audio_url)
+            if entry and not os.path.exists(self._blob_path(entry)):
+                del self._entries[audio_url]
+                entry = None
+            if entry and time.time() - entry["validated"] < self.revalidate_after:
+                self.hits += 1
+                entry["used"] = time.time()
+                self._save_index()
+                return self._blob_path(entry)
+
+        headers = {}
+        if entry:
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        try:
+            result = call_sync("audio", self.policy,
+                               lambda cancel: self._download(audio_url, headers, cancel),
+                               self.resilience, cancel_event=cancel_event,
+                               discard=self._discard_download)
+        except Exception as e:
+            print(f"Error downloading audio: {e}")
+            return None
+
+        if result == "not_modified" and entry:
+            with self._lock:
+                self.hits += 1
+                self.revalidations += 1
+                entry["validated"] = entry["used"] = time.time()
+                self._entries[audio_url] = entry
+                self._save_index()
+            return self._blob_path(entry)
+
+        if not isinstance(result, tuple):
+            return None
+        tmp_path, digest, size, response_headers = result
+        with self._lock:
+            self.misses += 1
+            self.bytes_downloaded += size
+            return self._insert(audio_url, tmp_path, digest, size, response_headers)
+
+    def _download(self, audio_url, headers, cancel_event):
+        """
+        Make one download attempt into a temporary file
+        Returns:
+            "not_modified" for a 304, (tmp_path, sha256 hex, size, headers) for a
+            complete download, or None if it failed or was cancelled
+        """
+        tmp_path = os.path.join(self.cache_dir, f".download-{threading.get_ident()}.part")
+        try:
+            response = self.session.get(audio_url, headers=headers, stream=True,
+                                        timeout=self.policy.requests_timeout())
+
+            if response.status_code == 304 and headers:
+                response.close()
+                return "not_modified"
+
+            if response.status_code != 200:
+                response.close()
+                check_status(response.status_code)
+                print(f"Failed to download audio: {response.status_code}")
+                return None
+
+            digest = hashlib.sha256()
+            size = 0
+            with open(tmp_path, 'wb') as f:
+                for chunk in response.iter_content(chunk_size=8192):
+                    if cancel_event is not None and cancel_event.is_set():
+                        break
+                    if chunk:
+                        f.write(chunk)
+                        digest.update(chunk)
+                        size += len(chunk)
+            response.close()
+
+            if cancel_event is not None and cancel_event.is_set():
+                os.remove(tmp_path)
+                return None
+            return tmp_path, digest.hexdigest(), size, response.headers
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _discard_download(self, result):
+        """Remove the file of a download that lost a hedged race"""
+        if isinstance(result, tuple) and os.path.exists(result[0]):
+            os.remove(result[0])
+
+    def lookup(self, audio_url):
+        """
+        Return the cached copy of audio_url without touching the network
+        Returns:
+            str: Path to the cached file, or None if it is missing or stale
+        """
+        with self._lock:
+            entry = self._entries.get(audio_url)
+            if not entry or not os.path.exists(self._blob_path(entry)):
+                return None
+            if time.time() - entry["validated"] >= self.revalidate_after:
+                return None
+            self.hits += 1
+            entry["used"] = time.time()
+            self._save_index()
+            return self._blob_path(entry)
+
+    def store(self, audio_url, data, headers=None):
+        """
+        Add audio that was downloaded outside fetch(), e.g. while streaming
+        Args:
+            audio_url: URL the audio was downloaded from
+            data: Complete audio bytes, or a binary file object read to its end
+            headers: Response headers carrying ETag / Last-Modified
+        Returns:
+            str: Path to the cached file
+        """
+        tmp_path = os.path.join(self.cache_dir, f".store-{threading.get_ident()}.part")
+        digest = hashlib.sha256()
+        size = 0
+        with open(tmp_path, 'wb') as f:
+            chunks = iter(lambda: data.read(64 * 1024), b'') if hasattr(data, 'read') else [data]
+            for chunk in chunks:
+                f.write(chunk)
+                digest.update(chunk)
+                size += len(chunk)
+        with self._lock:
+            self.misses += 1
+            self.bytes_downloaded += size
+            return self._insert(audio_url, tmp_path, digest.hexdigest(), size, headers or {})
+
+    def stats(self):
+        """
+        Returns:
+            dict: Hit/miss counters and current cache size
+        """
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "revalidations": self.revalidations,
+                "evictions": self.evictions,
+                "bytes_downloaded": self.bytes_downloaded,
+                "entries": len(self._entries),
+                "bytes_cached": self._total_bytes(),
+            }
+
+    def _insert(self, audio_url, tmp_path, digest, size, headers):
+        """Move a downloaded file into the blob store and index it (lock held)"""
+        filename = unquote(audio_url.split('/')[-1].split('?')[0])
+        entry = {
+            "blob": digest + os.path.splitext(filename)[1],
+            "size": size,
+            "etag": headers.get("ETag"),
+            "last_modified": headers.get("Last-Modified"),
+            "validated": time.time(),
+            "used": time.time(),
+        }
+        blob_path = self._blob_path(entry)
+        if os.path.exists(blob_path):
+            os.remove(tmp_path)
+        else:
+            os.replace(tmp_path, blob_path)
+        self._entries[audio_url] = entry
+        self._evict(keep=audio_url)
+        self._save_index()
+        return blob_path
+
+    def _blob_path(self, entry):
+        return os.path.join(self.blob_dir, entry["blob"])
+
+    def _total_bytes(self):
+        blobs = {entry["blob"]: entry["size"] for entry in self._entries.values()}
+        return sum(blobs.values())
+
+    def _evict(self, keep=None):
+        """Drop least recently used entries until the cache fits in max_bytes"""
+        by_age = sorted(self._entries.items(), key=lambda item: item[1]["used"])
+        for url, entry in by_age:
+            if self._total_bytes() <= self.max_bytes:
+                break
+            if url == keep:
+                continue
+            del self._entries[url]
+            self.evictions += 1
+            # Blobs are shared between URLs with identical audio
+            if not any(e["blob"] == entry["blob"] for e in self._entries.values()):
+                blob_path = self._blob_path(entry)
+                if os.path.exists(blob_path):
+                    os.remove(blob_path)
+
+    def _load_index(self):
+        if not os.path.exists(self.index_path):
+            return {}
+        try:
+            with open(self.index_path, 'r') as f:
+                return json.load(f)
+        except Exception as e:
+            print(f"Ignoring unreadable cache index: {e}")
+            return {}
+
+    def _save_index(self):
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f)
+        os.replace(tmp_path, self.index_path)
@@ -0,0 +1,172 @@
+"""
+Condition recorded queries before they are uploaded
+
+A query recording usually carries silence before and after the question,
+a DC offset from the microphone and a level that depends on how far the
+user holds the device. condition_wav() fixes all of that in a few
+vectorised NumPy passes over the whole clip:
+
+    1. remove the DC offset
+    2. trim leading/trailing silence (keeping a short pad)
+    3. normalise the speech level, without letting peaks clip
+    4. optionally resample
+
+and reports what it removed and what it cost. Benchmark a recording with:
+
+    python audio_conditioning.py recording.wav
+"""
+import io
+import sys
+import time
+import wave
+import numpy as np
+from live_upload import wav_header
+from vad import MIN_SPEECH_DBFS, frame_features
+
+def condition_wav(wav_bytes, target_rate=None, trim=True, pad=0.15, target_dbfs=-20.0,
+                  max_gain_db=20.0, peak_dbfs=-1.0):
+    """
+    Trim, de-offset, normalise and optionally resample a 16-bit mono WAV
+    Args:
+        wav_bytes: Complete WAV file
+        target_rate: Sample rate to resample to, None to keep the recorded rate
+        trim: Cut silence before and after the speech
+        pad: Seconds of silence kept around the speech when trimming
+        target_dbfs: RMS level of the speech after normalising, None to keep the gain
+        max_gain_db: Largest boost applied to quiet recordings
+        peak_dbfs: Level the loudest sample may reach after the gain
+    Returns:
+        tuple: (conditioned WAV bytes, report dict), or (wav_bytes, None) if the
+            recording is not 16-bit mono PCM
+    """
+    begin = time.perf_counter()
+    try:
+        with wave.open(io.BytesIO(wav_bytes), 'rb') as wf:
+            rate, channels, sampwidth = wf.getframerate(), wf.getnchannels(), wf.getsampwidth()
+            pcm = wf.readframes(wf.getnframes())
+    except (wave.Error, EOFError) as e:
+        print(f"Not conditioning audio: {e or type(e).__name__}")
+        return wav_bytes, None
+    if channels != 1 or sampwidth != 2:
+        print(f"Not conditioning audio: {channels} channels of {sampwidth * 8}-bit samples")
+        return wav_bytes, None
+
+    samples = np.frombuffer(pcm, dtype=np.int16)
+    report = {
+        "input_seconds": len(samples) / float(rate),
+        "input_bytes": len(wav_bytes),
+        "clipped_samples": int(np.count_nonzero((samples == 32767) | (samples == -32768))),
+    }
+    signal = samples.astype(np.float32)
+
+    dc_offset = float(signal.mean()) if len(signal) else 0.0
+    signal -= dc_offset
+    report["dc_offset"] = dc_offset
+
+    bounds = speech_bounds(signal, rate, pad)
+    if trim and bounds:
+        signal = signal[bounds[0]:bounds[1]]
+
+    # A recording without speech is left as quiet as it is
+    gain_db = 0.0
+    if target_dbfs is not None and bounds:
+        gain_db = normalise_gain(signal, target_dbfs, max_gain_db, peak_dbfs)
+        signal *= 10.0 ** (gain_db / 20.0)
+    report["gain_db"] = gain_db
+    report["speech_found"] = bounds is not None
+
+    if target_rate and target_rate != rate and len(signal):
+        signal = resample(signal, rate, target_rate)
+        rate = target_rate
+
+    out = np.clip(np.round(signal), -32768, 32767).astype(np.int16).tobytes()
+    conditioned = wav_header(rate, 1, 2, len(out) // 2) + out
+    report.update(
+        output_seconds=len(out) / 2.0 / rate,
+        output_bytes=len(conditioned),
+        elapsed_ms=(time.perf_counter() - begin) * 1000,
+    )
+    report["removed_seconds"] = report["input_seconds"] - report["output_seconds"]
+    report["removed_bytes"] = report["input_bytes"] - report["output_bytes"]
+    return conditioned, report
+
+def speech_bounds(signal, rate, pad, frame_ms=20):
+    """
+    Find where speech starts and ends
+    Args:
+        signal: Float samples in int16 scale, DC already removed
+        rate: Sample rate in Hz
+        pad: Seconds kept on either side of the speech
+    Returns:
+        tuple: (start, end) sample indices, or None if no speech stands out
+    """
+    frame_len = max(2, int(rate * frame_ms / 1000))
+    if len(signal) < frame_len:
+        return None
+    level, _ = frame_features(signal, frame_len)
+    # Speech is 12 dB above the quietest frames, or halfway to the loudest
+    # one when the whole recording is quiet
+    floor = np.percentile(level, 10)
+    threshold = max(MIN_SPEECH_DBFS, floor + min(12.0, (level.max() - floor) / 2.0))
+    voiced = np.flatnonzero(level >= threshold)
+    if len(voiced) == 0 or level.max() - floor < 6.0:
+        return None
+    pad_samples = int(pad * rate)
+    start = max(0, voiced[0] * frame_len - pad_samples)
+    end = min(len(signal), (voiced[-1] + 1) * frame_len + pad_samples)
+    return start, end
+
+def normalise_gain(signal, target_dbfs, max_gain_db, peak_dbfs):
+    """
+    Returns:
+        float: Gain in dB bringing the RMS level to target_dbfs, limited by
+            max_gain_db and by the peak it would produce
+    """
+    rms = float(np.sqrt(np.mean(signal * signal)))
+    peak = float(np.abs(signal).max())
+    if rms < 1.0 or peak < 1.0:
+        return 0.0
+    level_dbfs = 20.0 * np.log10(rms / 32768.0)
+    headroom_db = peak_dbfs - 20.0 * np.log10(peak / 32768.0)
+    return float(min(target_dbfs - level_dbfs, max_gain_db, headroom_db))
+
+def resample(signal, rate, target_rate):
+    """
+    Resample by linear interpolation, averaging first when downsampling
+    Returns:
+        numpy.ndarray: Float samples at target_rate
+    """
+    ratio = rate / float(target_rate)
+    if ratio > 1.0:
+        # Box filter as a cheap anti-aliasing low-pass
+        width = int(np.ceil(ratio))
+        signal = np.convolve(signal, np.full(width, 1.0 / width, dtype=np.float32), mode='same')
+    count = int(round(len(signal) / ratio))
+    positions = np.arange(count, dtype=np.float64) * ratio
+    return np.interp(positions, np.arange(len(signal)), signal).astype(np.float32)
+
+def describe(report):
+    """One-line summary of a conditioning report"""
+    text = (f"{report['input_seconds']:.1f} s -> {report['output_seconds']:.1f} s "
+            f"(removed {report['removed_seconds']:.1f} s, {report['removed_bytes'] / 1024:.1f} KB), "
+            f"gain {report['gain_db']:+.1f} dB, DC {report['dc_offset']:+.0f}, "
+            f"{report['elapsed_ms']:.1f} ms")
+    if not report['speech_found']:
+        text += ", no speech found"
+    if report['clipped_samples']:
+        text += f", {report['clipped_samples']} clipped samples in the recording"
+    return text
+
+def main():
+    if len(sys.argv) not in (2, 3):
+        print("Usage: python audio_conditioning.py <recording.wav> [target rate]")
+        return
+    with open(sys.argv[1], 'rb') as f:
+        wav_bytes = f.read()
+    target_rate = int(sys.argv[2]) if len(sys.argv) == 3 else None
+    _, report = condition_wav(wav_bytes, target_rate=target_rate)
+    if report:
+        print(describe(report))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+import io
+import os
+import threading
+from collections import deque
+import pygame
+
+class PlaybackHandle:
+    """Completion signal for one queued clip"""
+    def __init__(self, source, on_done=None):
+        self.source = source
+        self.on_done = on_done
+        self.sound = None
+        self.cancelled = False
+        self.error = None
+        self._done = threading.Event()
+
+    def wait(self, timeout=None):
+        """
+        Block until the clip has finished playing or was cancelled
+        Returns:
+            bool: True if the clip finished before the timeout
+        """
+        return self._done.wait(timeout)
+
+    @property
+    def done(self):
+        return self._done.is_set()
+
+    def _finish(self, cancelled=False, error=None):
+        self.cancelled = cancelled
+        self.error = error
+        self.sound = None
+        self._done.set()
+        if self.on_done:
+            try:
+                self.on_done(self)
+            except Exception as e:
+                print(f"Playback callback failed: {e}")
+
+class AudioOutputEngine:
+    """
+    Long-lived audio output that plays queued clips back to back
+
+    The mixer device is opened once and kept open. Clips are decoded ahead
+    of time and handed to a pygame Channel's queue slot, so the next clip
+    starts on the same audio buffer the previous one ends on. Completion is
+    read from the channel's state on the scheduling thread and reported
+    through PlaybackHandle events and callbacks, so callers never poll
+    get_busy() themselves.
+    """
+    def __init__(self, frequency=44100, size=-16, channels=2, buffer=1024):
+        self.frequency = frequency
+        self.size = size
+        self.channels = channels
+        self.buffer = buffer
+
+        self._queue = deque()
+        self._playing = deque()
+        self._cond = threading.Condition()
+        self._channel = None
+        self._thread = None
+        self._closed = False
+
+    def start(self):
+        """Open the output device and start the scheduling thread"""
+        with self._cond:
+            if self._thread is not None:
+                return
+            if not pygame.mixer.get_init():
+                pygame.mixer.init(self.frequency, self.size, self.channels, self.buffer)
+            self._channel = pygame.mixer.Channel(0)
+            pygame.mixer.set_reserved(1)
+            self._closed = False
+            self._thread = threading.Thread(target=self._run, name="audio-output", daemon=True)
+            self._thread.start()
+
+    def enqueue(self, source, on_done=None):
+        """
+        Queue a clip for playback after everything already queued
+        Args:
+            source: Path to an audio file, raw file bytes, or a binary file-like object
+            on_done: Optional callback receiving the PlaybackHandle when the clip ends
+        Returns:
+            PlaybackHandle: Completion signal for the clip
+        """
+        self.start()
+        handle = PlaybackHandle(source, on_done)
+        try:
+            handle.sound = self._decode(source)
+        except Exception as e:
+            print(f"Could not load audio: {e}")
+            handle._finish(error=e)
+            return handle
+        with self._cond:
+            self._queue.append(handle)
+            self._cond.notify_all()
+        return handle
+
+    def play(self, source):
+        """
+        Queue a clip and wait until it has finished playing
+        Returns:
+            PlaybackHandle: Completion signal for the clip
+        """
+        handle = self.enqueue(source)
+        handle.wait()
+        return handle
+
+    def stop(self):
+        """Stop the current clip and drop everything queued"""
+        with self._cond:
+            if self._channel is not None:
+                self._channel.stop()
+            cancelled = list(self._playing) + list(self._queue)
+            self._playing.clear()
+            self._queue.clear()
+            self._cond.notify_all()
+        for handle in cancelled:
+            handle._finish(cancelled=True)
+
+    def close(self):
+        """Stop playback and release the output device"""
+        self.stop()
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        if pygame.mixer.get_init():
+            pygame.mixer.quit()
+
+    @property
+    def idle(self):
+        with self._cond:
+            return not self._playing and not self._queue
+
+    def _decode(self, source):
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = io.BytesIO(source)
+        if isinstance(source, str):
+            if not os.path.exists(source):
+                raise FileNotFoundError(f"Audio file not found: {source}")
+            return pygame.mixer.Sound(source)
+        return pygame.mixer.Sound(file=source)
+
+    def _run(self):
+        # _playing[0] is the audible clip and _playing[1] (if any) sits in the
+        # channel's queue slot. The mixer callback moves the queued sound into
+        # place when the current one ends, so completion is read back from
+        # get_sound()/get_queue() rather than estimated from clip lengths. The
+        # channel state can only change once per device buffer, so polling at
+        # half that period is enough to refill the queue slot in time.
+        poll = self.buffer / float(self.frequency) / 2
+        with self._cond:
+            while not self._closed:
+                current = self._channel.get_sound()
+                queued = self._channel.get_queue()
+                finished = []
+                while self._playing and self._playing[0].sound is not current \
+                        and self._playing[0].sound is not queued:
+                    finished.append(self._playing.popleft())
+
+                if self._queue and current is None and queued is None:
+                    handle = self._queue.popleft()
+                    self._channel.play(handle.sound)
+                    self._playing.append(handle)
+                    current = handle.sound
+                if self._queue and current is not None and queued is None:
+                    # queue() replaces whatever waits in the slot, so it is
+                    # only filled once the previous clip has moved up
+                    handle = self._queue.popleft()
+                    self._channel.queue(handle.sound)
+                    self._playing.append(handle)
+
+                if finished:
+                    self._cond.release()
+                    try:
+                        for handle in finished:
+                            handle._finish()
+                    finally:
+                        self._cond.acquire()
+                    continue
+
+                if self._playing:
+                    self._cond.wait(poll)
+                else:
+                    self._cond.wait()
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_output_engine():
+    """
+    Return the process-wide output engine, opening the device on first use
+    """
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = AudioOutputEngine()
+        _engine.start()
+        return _engine
@@ -1,9 +1,20 @@
-import requests 
-import pygame
-import time
-from urllib.parse import unquote
+from http_session import get_session
 import json
 import os
+from sentence_prefetcher import SentencePrefetcher, load_pending, save_pending
+from audio_cache import AudioCache
+from audio_output import get_output_engine
+from streaming_audio import play_stream, content_length_of
+from request_policy import get_policy, call_sync, check_status, resilience_stats
+
+# Number of clips and bytes kept ready ahead of playback
+PREFETCH_DEPTH = 3
+PREFETCH_MAX_BYTES = 8 * 1024 * 1024
+
+BOOK_ID = "1735953778384-Atomic habits ( PDFDrive ) shorter.pdf"
+
+# Sentences handed out by the server but not played, kept next to the cache index
+PENDING_SENTENCES_FILE = "pending.json"
 
 def ensure_audio_directory():
     """
@@ -20,76 +31,116 @@ def get_next_sentence():
     """
     
     api_url = "http://192.168.100.160:3100/next-sentence"
-    book_id = "1735953778384-Atomic habits ( PDFDrive ) shorter.pdf"
-    api_url = f"{api_url}?book_id={book_id}"
+    api_url = f"{api_url}?book_id={BOOK_ID}"
     
-    try:
-        response = requests.post(api_url)
+    policy = get_policy("/next-sentence")
+    
+    def attempt(cancel_event):
+        response = get_session().post(api_url, timeout=policy.requests_timeout())
         if response.status_code == 200:
             # Parse JSON string and remove extra quotes
             return json.loads(response.text)
-        else:
-            print(f"API call failed: {response.status_code}")
-            return None
+        check_status(response.status_code)
+        print(f"API call failed: {response.status_code}")
+        return None
+    
+    try:
+        return call_sync("/next-sentence", policy, attempt)
     except Exception as e:
         print(f"Error occurred: {e}")
         return None
 
+_audio_cache = None
+
+def get_audio_cache():
+    """
+    Return the shared on-disk audio cache, creating it on first use
+    """
+    global _audio_cache
+    if _audio_cache is None:
+        _audio_cache = AudioCache(os.path.join(ensure_audio_directory(), 'cache'))
+    return _audio_cache
+
+def download_audio(audio_url, cancel_event=None):
+    """
+    Fetch audio file through the on-disk audio cache
+    Args:
+        audio_url: URL of the audio file
+        cancel_event: Optional threading.Event that aborts the download when set
+    Returns:
+        str: Path to the cached file, or None if the download fails
+    """
+    return get_audio_cache().fetch(audio_url, cancel_event)
+
+def play_audio_file(file_path):
+    """
+    Play a downloaded audio file
+    """
+    print("Starting playback...")
+    # Device stays open between sentences; play() returns when the clip ends
+    handle = get_output_engine().play(file_path)
+    if handle.error is None:
+        print("Playback complete")
+
 def download_and_play_audio(audio_url):
     """
-    Download and play audio file
+    Play audio file, streaming it while it downloads if it is not cached
     """
-    try:
-        # Ensure audio directory exists
-        audio_dir = ensure_audio_directory()
+    cache = get_audio_cache()
+    file_path = cache.lookup(audio_url)
+    if file_path:
+        play_audio_file(file_path)
+        return
         
-        # Download audio file
+    try:
         print("Starting download...")
-        response = requests.get(audio_url, stream=True)
-        if response.status_code == 200:
-            # Parse filename from URL and create full path
-            filename = unquote(audio_url.split('/')[-1].split('?')[0])
-            file_path = os.path.join(audio_dir, filename)
-            
-            # Save audio file
-            print(f"Saving file: {filename}")
-            with open(file_path, 'wb') as f:
-                for chunk in response.iter_content(chunk_size=8192):
-                    if chunk:
-                        f.write(chunk)
-            
-            print("Starting playback...")
-            # Initialize pygame
-            pygame.mixer.init()
-            
-            # Load and play audio file
-            pygame.mixer.music.load(file_path)
-            pygame.mixer.music.play()
-            
-            # Wait for playback to finish
-            while pygame.mixer.music.get_busy():
-                time.sleep(0.1)
-                
-            # Cleanup
-            pygame.mixer.quit()
-            print("Playback complete")
-            
-        else:
+        response = get_session().get(audio_url, stream=True,
+                                     timeout=get_policy("audio").requests_timeout())
+        if response.status_code != 200:
             print(f"Failed to download audio: {response.status_code}")
+            return
             
+        # Playback starts once a small jitter buffer has arrived
+        print("Starting playback...")
+        buffer = play_stream(response.iter_content(chunk_size=8192),
+                             content_length=content_length_of(response.headers))
+        if buffer and buffer.done and not buffer.error:
+            buffer.seek(0)
+            cache.store(audio_url, buffer, response.headers)
+        print("Playback complete")
+        
     except Exception as e:
         print(f"Error during playback: {e}")
 
 def main():
     print("Program started. Press Enter to play next sentence, 'q' to quit")
-    while True:
-        audio_url = get_next_sentence()
-        if audio_url:
-            print(f"Received audio URL: {audio_url}")
-            download_and_play_audio(audio_url)
-        user_input = input("Press Enter for next sentence, 'q' to quit: ")
-        if user_input.lower() == 'q':
-            break
+    # Resolve and download upcoming sentences while the current one plays
+    pending_path = os.path.join(get_audio_cache().cache_dir, PENDING_SENTENCES_FILE)
+    prefetcher = SentencePrefetcher(get_next_sentence, download_audio,
+                                    depth=PREFETCH_DEPTH, max_bytes=PREFETCH_MAX_BYTES,
+                                    pending=load_pending(pending_path, BOOK_ID))
+    prefetcher.start()
+    try:
+        while True:
+            clip = prefetcher.next_clip(timeout=30)
+            if clip:
+                audio_url, file_path = clip
+                print(f"Received audio URL: {audio_url}")
+                play_audio_file(file_path)
+            else:
+                print("No sentence available")
+            user_input = input("Press Enter for next sentence, 'q' to quit: ")
+            if user_input.lower() == 'q':
+                break
+    finally:
+        prefetcher.stop()
+        save_pending(pending_path, BOOK_ID, prefetcher.leftovers())
+        stats = get_audio_cache().stats()
+        print(f"Audio cache: {stats['hits']} hits, {stats['misses']} misses, "
+              f"{stats['bytes_cached'] / 1024 / 1024:.1f} MB cached")
+        for endpoint, counts in sorted(resilience_stats().items()):
+            print(f"{endpoint}: {counts['timeouts']} timeouts, {counts['retries']} retries, "
+                  f"{counts['hedges']} hedges ({counts['hedge_wins']} won)")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,394 @@
+"""
+Client benchmarks against the local stub server
+
+Each benchmark starts stub_server.StubServer in-process and drives the
+real APIClient / AudioPlayer code against it, headless (SDL dummy audio
+driver unless one is set). Run one benchmark or the whole suite:
+
+    python benchmark_client.py all
+    python benchmark_client.py queries --runs 20 --latency 0.2 --bandwidth 128
+    python benchmark_client.py audiobook --sentences 20 --clip-seconds 0.25
+    python benchmark_client.py batch --sentences 200 --batch-size 10 --latency 0.02
+    python benchmark_client.py upload --seconds 3 --bandwidth 32
+    python benchmark_client.py resilience --clips 100 --slow-ratio 0.05 --error-ratio 0.05
+    python benchmark_client.py camera --runs 10 --warmup 1.0 --fps 30
+
+The camera benchmark needs no server: it compares starting a camera per
+photo with the warm CameraService, on the fake frame source by default.
+"""
+import os
+import time
+import wave
+import argparse
+import shutil
+import tempfile
+import threading
+# Play through a silent driver so the suite runs on machines without audio
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+from PIL import Image
+from stub_server import StubServer, make_ramp, make_wav
+from http_session import PoolStats
+from async_api_client import AsyncAPIClient
+from live_upload import LiveAudioUpload
+from audio_cache import AudioCache
+from request_policy import RequestPolicy, ResilienceStats
+from latency_trace import percentile
+from sentence_prefetcher import SentencePrefetcher
+from camera_service import CameraService, FakeFrameSource, make_source
+from smart_media_assistant import APIClient, AudioPlayer
+
+def report(name, latencies, items, elapsed):
+    """Print throughput and latency percentiles for one benchmark run"""
+    print(f"{name:<28} {items:>6} items  {elapsed:7.3f} s  {items / elapsed if elapsed else 0:8.1f} items/s  "
+          f"p50 {percentile(latencies, 50) * 1000:7.1f} ms  "
+          f"p95 {percentile(latencies, 95) * 1000:7.1f} ms  "
+          f"p99 {percentile(latencies, 99) * 1000:7.1f} ms")
+
+def _kb_per_s(value):
+    return value * 1024 if value else None
+
+def make_test_image(path, width=1920, height=1080):
+    """Write a camera-sized JPEG with some detail so it compresses realistically"""
+    image = Image.effect_noise((width, height), 40).convert('RGB')
+    image.save(path, format='JPEG', quality=90)
+    return path
+
+def bench_queries(args):
+    """Voice, OCR and vision queries end to end, without playing the answers"""
+    server = StubServer(latency=args.latency, answer_seconds=args.answer_seconds,
+                        bandwidth=_kb_per_s(args.bandwidth),
+                        download_bandwidth=_kb_per_s(args.download_bandwidth)).start()
+    work_dir = tempfile.mkdtemp(prefix="bench-queries-")
+    client = APIClient(async_client=AsyncAPIClient(server.url, temp_dir=work_dir))
+    try:
+        image_path = make_test_image(os.path.join(work_dir, "image.jpg"))
+        audio_path = os.path.join(work_dir, "query.wav")
+        with open(audio_path, 'wb') as f:
+            f.write(make_wav(args.query_seconds))
+
+        queries = (
+            ("/rag-voice-assistant", lambda: client.send_voice_query(audio_path)),
+            ("/process-ocr-image-and-audio", lambda: client.send_ocr_query(image_path, audio_path)),
+            ("/process-text-and-image", lambda: client.process_vision_query(image_path, audio_path)),
+        )
+        for name, send in queries:
+            latencies = []
+            failures = 0
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                t0 = time.perf_counter()
+                if send() is None:
+                    failures += 1
+                latencies.append(time.perf_counter() - t0)
+            report(name, latencies, args.runs, time.perf_counter() - start)
+            transfers = [t for t in client.async_client.transfers if t.endpoint == name]
+            sent = sum(t.bytes_sent for t in transfers) / max(1, len(transfers))
+            ttfb = [t.first_byte_time for t in transfers if t.first_byte_time is not None]
+            print(f"{'':<28} {sent / 1024:.1f} KB sent per query, "
+                  f"TTFB p50 {percentile(ttfb, 50) * 1000:.1f} ms, {failures} failed")
+    finally:
+        client.close()
+        server.stop()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+def bench_audiobook(args):
+    """Gap between sentences: download-then-play versus the prefetcher"""
+    server = StubServer(sentences=args.sentences, latency=args.latency,
+                        clip_seconds=args.clip_seconds,
+                        download_bandwidth=_kb_per_s(args.download_bandwidth)).start()
+    try:
+        for name in ("download and play", "prefetched"):
+            server.state.reset()
+            cache_dir = tempfile.mkdtemp(prefix="bench-cache-")
+            client = APIClient(async_client=AsyncAPIClient(server.url))
+            player = AudioPlayer(cache=AudioCache(cache_dir))
+            gaps = []
+            start = time.perf_counter()
+            try:
+                if name == "prefetched":
+                    prefetcher = SentencePrefetcher(client.get_next_sentence, player.download_audio,
+                                                    resolve_batch=client.get_next_sentences)
+                    prefetcher.start()
+                    while True:
+                        t0 = time.perf_counter()
+                        clip = prefetcher.next_clip(timeout=30)
+                        if clip is None:
+                            break
+                        gaps.append(time.perf_counter() - t0)
+                        player.play_audio(clip[1])
+                    prefetcher.stop()
+                else:
+                    while True:
+                        t0 = time.perf_counter()
+                        audio_url = client.get_next_sentence()
+                        if not audio_url:
+                            break
+                        player.download_and_play_audio(audio_url)
+                        # Time not spent playing the clip
+                        gaps.append(max(0.0, time.perf_counter() - t0 - args.clip_seconds))
+                report(f"audiobook, {name}", gaps, len(gaps), time.perf_counter() - start)
+            finally:
+                client.close()
+                shutil.rmtree(cache_dir, ignore_errors=True)
+    finally:
+        server.stop()
+
+def bench_batch(args):
+    """Resolve a whole book with single calls, batch calls and the batch fallback"""
+    server = StubServer(sentences=args.sentences, latency=args.latency).start()
+    stats = PoolStats()
+    try:
+        def run(name, resolve):
+            server.state.reset()
+            stats.reset()
+            latencies = []
+            items = 0
+            start = time.perf_counter()
+            while True:
+                t0 = time.perf_counter()
+                resolved = resolve()
+                latencies.append(time.perf_counter() - t0)
+                if not resolved:
+                    break
+                items += resolved
+            elapsed = time.perf_counter() - start
+            report(name, latencies, items, elapsed)
+            print(f"{'':<28} {sum(server.state.requests.values())} server requests, "
+                  f"{stats.new_connections} connections opened")
+            client.close()
+
+        client = APIClient(async_client=AsyncAPIClient(server.url, stats=stats))
+        run("single /next-sentence", lambda: 1 if client.get_next_sentence() else 0)
+
+        client = APIClient(async_client=AsyncAPIClient(server.url, stats=stats))
+        run(f"batch of {args.batch_size}", lambda: len(client.get_next_sentences(args.batch_size) or []))
+
+        server.state.batch = False
+        client = APIClient(async_client=AsyncAPIClient(server.url, stats=stats))
+        run(f"fallback batch of {args.batch_size}",
+            lambda: len(client.get_next_sentences(args.batch_size) or []))
+    finally:
+        server.stop()
+
+def simulate_recording(seconds, upload=None, rate=16000, chunk=1024):
+    """
+    Produce ramp audio at real-time pace, like AudioRecorder.record_audio
+    Args:
+        seconds: Length of the recording
+        upload: Optional LiveAudioUpload receiving each chunk
+    Returns:
+        tuple: (PCM bytes, perf_counter time when recording stopped)
+    """
+    frames = []
+    nchunks = int(rate / chunk * seconds)
+    start = time.perf_counter()
+    for i in range(nchunks):
+        # Wait until the microphone would have delivered this chunk
+        delay = start + (i + 1) * chunk / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        data = make_ramp(i * chunk, chunk)
+        frames.append(data)
+        if upload:
+            upload.write(data)
+    if upload:
+        upload.close()
+    return b''.join(frames), time.perf_counter()
+
+def bench_upload(args):
+    """Compare record-then-upload with uploading while recording"""
+    rate, chunk = 16000, 1024
+    nframes = int(rate / chunk * args.seconds) * chunk
+    server = StubServer(latency=args.latency, answer_seconds=0.5,
+                        bandwidth=args.bandwidth * 1024 if args.bandwidth else None).start()
+    # Both modes upload plain WAV so only the timing differs
+    client = APIClient(async_client=AsyncAPIClient(
+        server.url, uplink_codecs={}, temp_dir=tempfile.mkdtemp(prefix="bench-")))
+    wav_path = os.path.join(client.async_client.temp_dir, "query.wav")
+    results = {}
+    try:
+        def record_then_upload():
+            pcm, stopped = simulate_recording(args.seconds, rate=rate, chunk=chunk)
+            wf = wave.open(wav_path, 'wb')
+            wf.setnchannels(1)
+            wf.setsampwidth(2)
+            wf.setframerate(rate)
+            wf.writeframes(pcm)
+            wf.close()
+            client.send_voice_query(wav_path)
+            return stopped
+
+        def live_upload():
+            upload = LiveAudioUpload(rate, 1, 2, nframes=nframes)
+            stopped = []
+            recording = threading.Thread(
+                target=lambda: stopped.append(simulate_recording(args.seconds, upload, rate, chunk)[1]))
+            recording.start()
+            client.send_voice_query(upload)
+            recording.join()
+            return stopped[0]
+
+        for name, run in (("record then upload", record_then_upload),
+                          ("upload while recording", live_upload)):
+            server.state.reset()
+            latencies = []
+            start = time.perf_counter()
+            for _ in range(args.runs):
+                stopped = run()
+                latencies.append(time.perf_counter() - stopped)
+            report(name, latencies, args.runs, time.perf_counter() - start)
+            uploads = server.state.uploads
+            print(f"{'':<28} {sum(u['in_order'] for u in uploads)}/{len(uploads)} uploads in order, "
+                  f"{sum(u['chunked'] for u in uploads)} chunked")
+            results[name] = sum(latencies) / len(latencies)
+
+        saved = results["record then upload"] - results["upload while recording"]
+        print(f"Mean latency after recording stops: {saved * 1000:.0f} ms saved")
+    finally:
+        client.close()
+        server.stop()
+
+def bench_resilience(args):
+    """Sentence resolution and clip downloads against a server with a slow, flaky tail"""
+    server = StubServer(sentences=args.clips, latency=args.latency, clip_seconds=0.5,
+                        slow_ratio=args.slow_ratio, slow_latency=args.slow_latency,
+                        error_ratio=args.error_ratio, seed=1).start()
+    try:
+        for hedge_after in (None, args.hedge_after):
+            server.state.reset()
+            stats = ResilienceStats()
+            policy = RequestPolicy(connect_timeout=3.0, read_timeout=10.0, retries=3,
+                                   backoff_base=0.05, hedge_after=hedge_after)
+            client = APIClient(async_client=AsyncAPIClient(
+                server.url, policies={"/next-sentences": RequestPolicy(retries=3, backoff_base=0.05)},
+                resilience=stats))
+            cache_dir = tempfile.mkdtemp(prefix="bench-cache-")
+            cache = AudioCache(cache_dir, policy=policy, resilience=stats)
+            name = f"hedge after {hedge_after} s" if hedge_after else "no hedging"
+            try:
+                latencies = []
+                failures = 0
+                start = time.perf_counter()
+                urls = client.get_next_sentences(args.clips) or []
+                for audio_url in urls:
+                    t0 = time.perf_counter()
+                    if cache.fetch(audio_url) is None:
+                        failures += 1
+                    latencies.append(time.perf_counter() - t0)
+                report(f"downloads, {name}", latencies, len(latencies), time.perf_counter() - start)
+                print(f"{'':<28} {failures} failed downloads")
+                for endpoint, counts in sorted(stats.snapshot().items()):
+                    print(f"{'':<28} {endpoint}: {counts}")
+            finally:
+                client.close()
+                shutil.rmtree(cache_dir, ignore_errors=True)
+    finally:
+        server.stop()
+
+def bench_camera(args):
+    """Photo latency with a camera started per photo vs kept warm"""
+    def new_source():
+        if args.source == 'fake':
+            return FakeFrameSource(framerate=args.fps, warmup=args.warmup)
+        return make_source(args.source)
+
+    latencies = []
+    start = time.perf_counter()
+    for _ in range(args.runs):
+        t0 = time.perf_counter()
+        service = CameraService(new_source())
+        if not service.start():
+            return
+        frame = service.capture()
+        if frame:
+            frame.jpeg()
+        service.stop()
+        latencies.append(time.perf_counter() - t0)
+    report("camera started per photo", latencies, len(latencies), time.perf_counter() - start)
+
+    service = CameraService(new_source())
+    if not service.start():
+        return
+    try:
+        latencies = []
+        start = time.perf_counter()
+        for _ in range(args.runs):
+            t0 = time.perf_counter()
+            frame = service.capture()
+            if frame:
+                frame.jpeg()
+            latencies.append(time.perf_counter() - t0)
+            # The user takes a moment between photos
+            time.sleep(args.interval)
+        report("warm camera", latencies, len(latencies), time.perf_counter() - start)
+    finally:
+        service.stop()
+
+BENCHMARKS = {
+    'queries': bench_queries,
+    'audiobook': bench_audiobook,
+    'batch': bench_batch,
+    'upload': bench_upload,
+    'resilience': bench_resilience,
+    'camera': bench_camera,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description="Client benchmarks against the local stub server")
+    subparsers = parser.add_subparsers(dest='benchmark', required=True)
+    subparsers.add_parser('all', help="Run every benchmark with its defaults")
+
+    queries = subparsers.add_parser('queries', help="Voice, OCR and vision query latency")
+    queries.add_argument('--runs', type=int, default=10)
+    queries.add_argument('--latency', type=float, default=0.2, help="Server processing time (s)")
+    queries.add_argument('--query-seconds', type=float, default=3.0, help="Length of the question")
+    queries.add_argument('--answer-seconds', type=float, default=2.0, help="Length of the answer")
+    queries.add_argument('--bandwidth', type=float, default=None, help="Upload bandwidth in KB/s")
+    queries.add_argument('--download-bandwidth', type=float, default=None,
+                         help="Download bandwidth in KB/s")
+
+    audiobook = subparsers.add_parser('audiobook', help="Gap between audiobook sentences")
+    audiobook.add_argument('--sentences', type=int, default=20)
+    audiobook.add_argument('--clip-seconds', type=float, default=0.25)
+    audiobook.add_argument('--latency', type=float, default=0.05, help="Server latency per request (s)")
+    audiobook.add_argument('--download-bandwidth', type=float, default=None,
+                           help="Download bandwidth in KB/s")
+
+    batch = subparsers.add_parser('batch', help="Single vs batch sentence resolution")
+    batch.add_argument('--sentences', type=int, default=200)
+    batch.add_argument('--batch-size', type=int, default=10)
+    batch.add_argument('--latency', type=float, default=0.02, help="Server latency per request (s)")
+
+    upload = subparsers.add_parser('upload', help="Record-then-upload vs upload while recording")
+    upload.add_argument('--seconds', type=float, default=3.0, help="Length of each recording")
+    upload.add_argument('--runs', type=int, default=3)
+    upload.add_argument('--bandwidth', type=float, default=32.0, help="Upload bandwidth in KB/s")
+    upload.add_argument('--latency', type=float, default=0.05, help="Server latency per request (s)")
+
+    resilience = subparsers.add_parser('resilience', help="Retries and hedging against a flaky server")
+    resilience.add_argument('--clips', type=int, default=100)
+    resilience.add_argument('--latency', type=float, default=0.01, help="Server latency per request (s)")
+    resilience.add_argument('--slow-ratio', type=float, default=0.05)
+    resilience.add_argument('--slow-latency', type=float, default=1.0)
+    resilience.add_argument('--error-ratio', type=float, default=0.05)
+    resilience.add_argument('--hedge-after', type=float, default=0.1)
+
+    camera = subparsers.add_parser('camera', help="Camera started per photo vs kept warm")
+    camera.add_argument('--runs', type=int, default=5)
+    camera.add_argument('--source', default='fake',
+                        help="Frame source: fake, picamera2 or libcamera-vid")
+    camera.add_argument('--fps', type=float, default=30.0, help="Frame rate of the fake source")
+    camera.add_argument('--warmup', type=float, default=1.0,
+                        help="Start-up time of the fake source (sensor init, exposure settling)")
+    camera.add_argument('--interval', type=float, default=0.2, help="Pause between warm photos (s)")
+
+    args = parser.parse_args()
+    if args.benchmark == 'all':
+        for name, benchmark in BENCHMARKS.items():
+            print(f"\n== {name} ==")
+            benchmark(parser.parse_args([name]))
+    else:
+        BENCHMARKS[args.benchmark](args)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,277 @@
+"""
+Offline whole-book download
+
+Resolves every sentence of a book and downloads the clips over a bounded
+thread pool into books/<book>/, keeping a manifest so an interrupted run
+continues where it stopped:
+
+    python book_downloader.py --workers 4
+"""
+import os
+import json
+import time
+import argparse
+import threading
+from http_session import create_session, POOL_MAXSIZE
+from request_policy import get_policy, call_sync, check_status
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from urllib.parse import unquote
+
+BOOKS_DIR = "books"
+
+def book_directory(book_id, books_dir=BOOKS_DIR):
+    """Return the local directory for book_id"""
+    safe_name = "".join(c if c.isalnum() or c in "-_." else "_" for c in book_id)
+    return os.path.join(books_dir, safe_name)
+
+class BookManifest:
+    """Resumable record of a book's sentence URLs and local files"""
+    def __init__(self, book_dir, book_id):
+        self.book_dir = book_dir
+        self.path = os.path.join(book_dir, "manifest.json")
+        self.book_id = book_id
+        self.sentences = []
+        self.resolved = False
+        self.position = 0
+        self._lock = threading.Lock()
+
+    @classmethod
+    def load(cls, book_dir, book_id=None):
+        """
+        Load the manifest in book_dir, or start an empty one
+        Returns:
+            BookManifest: The loaded or new manifest
+        """
+        manifest = cls(book_dir, book_id)
+        if os.path.exists(manifest.path):
+            with open(manifest.path, 'r') as f:
+                data = json.load(f)
+            manifest.book_id = data.get("book_id", book_id)
+            manifest.sentences = data.get("sentences", [])
+            manifest.resolved = data.get("resolved", False)
+            manifest.position = data.get("position", 0)
+        return manifest
+
+    def save(self):
+        os.makedirs(self.book_dir, exist_ok=True)
+        with self._lock:
+            data = {
+                "book_id": self.book_id,
+                "resolved": self.resolved,
+                "position": self.position,
+                "sentences": self.sentences,
+            }
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+
+    def add_urls(self, urls):
+        with self._lock:
+            for audio_url in urls:
+                index = len(self.sentences)
+                ext = os.path.splitext(unquote(audio_url.split('/')[-1].split('?')[0]))[1] or ".wav"
+                self.sentences.append({"url": audio_url, "file": f"{index:05d}{ext}"})
+
+    def file_path(self, sentence):
+        return os.path.join(self.book_dir, sentence["file"])
+
+    def is_downloaded(self, sentence):
+        # Clips are renamed into place only once complete
+        return os.path.exists(self.file_path(sentence))
+
+    @property
+    def complete(self):
+        return self.resolved and all(self.is_downloaded(s) for s in self.sentences)
+
+class BookDownloader:
+    """Download every sentence of a book for offline listening"""
+    def __init__(self, api_client, book_id, books_dir=BOOKS_DIR, workers=4, batch_size=20,
+                 max_sentences=100000):
+        """
+        Args:
+            api_client: APIClient used to resolve sentence URLs
+            book_id: Book to download
+            books_dir: Directory holding downloaded books
+            workers: Number of concurrent clip downloads
+            batch_size: Sentences resolved per request
+            max_sentences: Safety limit on the number of sentences resolved
+        """
+        self.api_client = api_client
+        self.book_id = book_id
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_sentences = max_sentences
+        self.policy = get_policy("audio")
+        self.manifest = BookManifest.load(book_directory(book_id, books_dir), book_id)
+
+        self.clips_done = 0
+        self.bytes_done = 0
+        self._stats_lock = threading.Lock()
+
+    def run(self):
+        """
+        Resolve and download the whole book, resuming any earlier run
+        Returns:
+            bool: True if every clip of the book is on disk
+        """
+        try:
+            self.resolve()
+            self.download()
+        finally:
+            self.manifest.save()
+        return self.manifest.complete
+
+    def resolve(self):
+        """Ask the server for sentence URLs until the book ends"""
+        manifest = self.manifest
+        if manifest.resolved:
+            return
+        print(f"Resolving sentences ({len(manifest.sentences)} already known)...")
+        while len(manifest.sentences) < self.max_sentences:
+            urls = self.api_client.get_next_sentences(self.batch_size, book_id=self.book_id)
+            if urls is None:
+                print("Resolving interrupted, run the download again to resume")
+                return
+            if not urls:
+                break
+            manifest.add_urls(urls)
+            manifest.save()
+        manifest.resolved = True
+        manifest.save()
+        print(f"Book has {len(manifest.sentences)} sentences")
+
+    def download(self):
+        """Fetch every missing clip over the thread pool and report throughput"""
+        pending = [s for s in self.manifest.sentences if not self.manifest.is_downloaded(s)]
+        if not pending:
+            print("All clips already downloaded")
+            return
+        print(f"Downloading {len(pending)} clips with {self.workers} workers...")
+
+        start = time.perf_counter()
+        failed = 0
+        # Size the pool so every worker keeps its own connection alive
+        session = create_session(pool_maxsize=max(self.workers, POOL_MAXSIZE))
+        with session, ThreadPoolExecutor(max_workers=self.workers) as pool:
+            futures = [pool.submit(self._download_clip, session, s) for s in pending]
+            for done, future in enumerate(as_completed(futures), 1):
+                if not future.result():
+                    failed += 1
+                if done % 50 == 0 or done == len(futures):
+                    self._print_progress(done, len(futures), time.perf_counter() - start)
+
+        if failed:
+            print(f"{failed} clips failed, run the download again to retry them")
+
+    def _download_clip(self, session, sentence):
+        try:
+            # Retries resume from the partial file; a hedge would race on it
+            return call_sync("audio", self.policy,
+                             lambda cancel: self._download_attempt(session, sentence), hedge=False)
+        except Exception as e:
+            print(f"Failed to download {sentence['file']}: {e}")
+            return False
+
+    def _download_attempt(self, session, sentence):
+        file_path = self.manifest.file_path(sentence)
+        part_path = file_path + ".part"
+        # Resume a partially written clip with a range request
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        headers = {'Range': f'bytes={offset}-'} if offset else {}
+        response = session.get(sentence["url"], headers=headers, stream=True,
+                               timeout=self.policy.requests_timeout())
+        if response.status_code == 200:
+            mode = 'wb'
+        elif response.status_code == 206:
+            mode = 'ab'
+        else:
+            response.close()
+            check_status(response.status_code)
+            print(f"Failed to download {sentence['file']}: {response.status_code}")
+            return False
+
+        size = 0
+        with open(part_path, mode) as f:
+            for chunk in response.iter_content(chunk_size=65536):
+                if chunk:
+                    f.write(chunk)
+                    size += len(chunk)
+        response.close()
+        os.replace(part_path, file_path)
+
+        with self._stats_lock:
+            self.clips_done += 1
+            self.bytes_done += size
+        return True
+
+    def _print_progress(self, done, total, elapsed):
+        with self._stats_lock:
+            clips_per_s = self.clips_done / elapsed if elapsed else 0.0
+            mb_per_s = self.bytes_done / 1024 / 1024 / elapsed if elapsed else 0.0
+        print(f"{done}/{total} clips  {clips_per_s:.1f} clips/s  {mb_per_s:.2f} MB/s")
+
+class OfflineBook:
+    """
+    Sentence source that plays a downloaded book from disk
+
+    Offers the same next_clip() / finished / start() / stop() interface as
+    SentencePrefetcher, and remembers the reading position in the manifest.
+    """
+    def __init__(self, manifest):
+        self.manifest = manifest
+
+    @classmethod
+    def open(cls, book_id, books_dir=BOOKS_DIR):
+        """
+        Returns:
+            OfflineBook: The downloaded book, or None if no complete copy exists
+        """
+        book_dir = book_directory(book_id, books_dir)
+        if not os.path.exists(os.path.join(book_dir, "manifest.json")):
+            return None
+        manifest = BookManifest.load(book_dir, book_id)
+        return cls(manifest) if manifest.complete else None
+
+    def start(self):
+        pass
+
+    def stop(self):
+        self.manifest.save()
+
+    @property
+    def finished(self):
+        return self.manifest.position >= len(self.manifest.sentences)
+
+    def give_back(self, clips):
+        """Step the reading position back over clips that were not played to the end"""
+        self.manifest.position = max(0, self.manifest.position - len(clips))
+
+    def next_clip(self, timeout=None):
+        """
+        Returns:
+            tuple: (audio_url, file_path) of the next sentence, or None at the end of the book
+        """
+        if self.finished:
+            return None
+        sentence = self.manifest.sentences[self.manifest.position]
+        self.manifest.position += 1
+        return sentence["url"], self.manifest.file_path(sentence)
+
+def main():
+    from smart_media_assistant import APIClient, DEFAULT_BOOK_ID
+
+    parser = argparse.ArgumentParser(description="Download a whole book for offline listening")
+    parser.add_argument('--base-url', default="http://192.168.100.160:3100")
+    parser.add_argument('--book-id', default=DEFAULT_BOOK_ID)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--batch-size', type=int, default=20)
+    args = parser.parse_args()
+
+    downloader = BookDownloader(APIClient(args.base_url), args.book_id,
+                                workers=args.workers, batch_size=args.batch_size)
+    if downloader.run():
+        print(f"Book ready for offline listening in {downloader.manifest.book_dir}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+"""
+Warm camera service
+
+Running libcamera-still for every photo pays process start-up, sensor
+initialisation and auto-exposure settling each time, which takes seconds.
+CameraService keeps one frame source running on a background thread and
+always holds the newest frame, so a capture only waits for the next frame.
+
+Frame sources share a small interface: start(), read() returning the next
+Frame (blocking at the source's frame rate) and stop(). Available sources:
+
+    Picamera2Source      picamera2, if installed
+    LibcameraVidSource   MJPEG frames piped from libcamera-vid
+    FakeFrameSource      generated pages, for running without a camera
+
+make_source() picks the first that can run here.
+"""
+import io
+import time
+import shutil
+import threading
+import subprocess
+import numpy as np
+from PIL import Image, ImageDraw, ImageFilter
+
+class Frame:
+    """One camera frame, kept as JPEG and/or RGB array and converted on demand"""
+    def __init__(self, index, timestamp, jpeg=None, array=None):
+        """
+        Args:
+            index: Sequence number from the source
+            timestamp: perf_counter() time the frame was received
+            jpeg: JPEG bytes of the frame
+            array: H x W x 3 uint8 RGB array of the frame
+        """
+        self.index = index
+        self.timestamp = timestamp
+        self._jpeg = jpeg
+        self._array = array
+
+    def jpeg(self, quality=90):
+        """
+        Returns:
+            bytes: The frame as JPEG, encoded once if the source produced an array
+        """
+        if self._jpeg is None:
+            buffer = io.BytesIO()
+            Image.fromarray(self._array).save(buffer, format='JPEG', quality=quality)
+            self._jpeg = buffer.getvalue()
+        return self._jpeg
+
+    def raw(self):
+        """
+        Returns:
+            bytes or numpy.ndarray: The frame as the source produced it, without converting
+        """
+        return self._jpeg if self._jpeg is not None else self._array
+
+    def array(self):
+        """
+        Returns:
+            numpy.ndarray: The frame as an H x W x 3 uint8 RGB array
+        """
+        if self._array is None:
+            with Image.open(io.BytesIO(self._jpeg)) as image:
+                self._array = np.asarray(image.convert('RGB'))
+        return self._array
+
+class Picamera2Source:
+    """Frames from picamera2's video pipeline"""
+    def __init__(self, width=1920, height=1080):
+        self.width = width
+        self.height = height
+        self._camera = None
+        self._index = 0
+
+    @staticmethod
+    def available():
+        try:
+            import picamera2  # noqa: F401
+        except ImportError:
+            return False
+        return True
+
+    def start(self):
+        from picamera2 import Picamera2
+        self._camera = Picamera2()
+        config = self._camera.create_video_configuration(
+            main={"size": (self.width, self.height), "format": "RGB888"})
+        self._camera.configure(config)
+        self._camera.start()
+
+    def read(self):
+        # RGB888 is stored as BGR in memory
+        array = self._camera.capture_array()[:, :, ::-1]
+        self._index += 1
+        return Frame(self._index, time.perf_counter(), array=np.ascontiguousarray(array))
+
+    def stop(self):
+        if self._camera is not None:
+            self._camera.stop()
+            self._camera.close()
+            self._camera = None
+
+class LibcameraVidSource:
+    """MJPEG frames from a long-running libcamera-vid process"""
+    def __init__(self, width=1920, height=1080, framerate=10):
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self._process = None
+        self._buffer = b''
+        self._index = 0
+
+    @staticmethod
+    def available():
+        return shutil.which('libcamera-vid') is not None
+
+    def start(self):
+        command = [
+            'libcamera-vid',
+            '-t', '0',
+            '--codec', 'mjpeg',
+            '--width', str(self.width),
+            '--height', str(self.height),
+            '--framerate', str(self.framerate),
+            '--nopreview',
+            '-o', '-'
+        ]
+        self._process = subprocess.Popen(command, stdout=subprocess.PIPE,
+                                         stderr=subprocess.DEVNULL)
+
+    def read(self):
+        # Each MJPEG frame is a complete JPEG from SOI (FFD8) to EOI (FFD9)
+        while True:
+            start = self._buffer.find(b'\xff\xd8')
+            end = self._buffer.find(b'\xff\xd9', start + 2) if start >= 0 else -1
+            if end >= 0:
+                jpeg = self._buffer[start:end + 2]
+                self._buffer = self._buffer[end + 2:]
+                self._index += 1
+                return Frame(self._index, time.perf_counter(), jpeg=jpeg)
+            data = self._process.stdout.read1(65536)
+            if not data:
+                raise RuntimeError("libcamera-vid stopped")
+            self._buffer += data
+
+    def stop(self):
+        if self._process is not None:
+            self._process.terminate()
+            try:
+                self._process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                self._process.kill()
+            self._process = None
+
+class FakeFrameSource:
+    """Generated book pages at a fixed frame rate, for tests and benchmarks"""
+    def __init__(self, width=1920, height=1080, framerate=30, warmup=0.0, variants=4,
+                 blur_ratio=0.0):
+        """
+        Args:
+            width: Frame width
+            height: Frame height
+            framerate: Frames per second delivered by read()
+            warmup: Seconds start() takes, standing in for sensor start-up and exposure settling
+            variants: Number of distinct frames cycled through
+            blur_ratio: Share of the variants rendered with camera shake
+        """
+        self.width = width
+        self.height = height
+        self.framerate = framerate
+        self.warmup = warmup
+        self.variants = variants
+        self.blur_ratio = blur_ratio
+        self._frames = []
+        self._index = 0
+        self._next_time = None
+
+    @staticmethod
+    def available():
+        return True
+
+    def start(self):
+        time.sleep(self.warmup)
+        blurred = int(round(self.variants * self.blur_ratio))
+        self._frames = [self.render(i, blurred=i < blurred) for i in range(self.variants)]
+        self._next_time = time.perf_counter()
+
+    def render(self, variant, blurred=False):
+        """
+        Returns:
+            bytes: JPEG of a page of text lines on a darker desk, shifted per
+                variant and smeared if blurred
+        """
+        image = Image.new('RGB', (self.width, self.height), (70, 60, 50))
+        draw = ImageDraw.Draw(image)
+        shift = variant * 4
+        left, top = self.width // 5 + shift, self.height // 10 + shift
+        right, bottom = self.width * 4 // 5 + shift, self.height * 9 // 10 + shift
+        draw.rectangle((left, top, right, bottom), fill=(235, 232, 225))
+        line_height = max(8, (bottom - top) // 30)
+        for y in range(top + line_height * 2, bottom - line_height * 2, line_height):
+            x = left + line_height * 2
+            while x < right - line_height * 4:
+                word = line_height * (1 + (x * 7 + y * 3) % 5)
+                draw.rectangle((x, y, min(x + word, right - line_height * 2), y + line_height // 2),
+                               fill=(30, 30, 30))
+                x += word + line_height
+        image = image.filter(ImageFilter.GaussianBlur(6 if blurred else 0.6))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=90)
+        return buffer.getvalue()
+
+    def read(self):
+        self._next_time += 1.0 / self.framerate
+        delay = self._next_time - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        else:
+            self._next_time = time.perf_counter()
+        self._index += 1
+        return Frame(self._index, time.perf_counter(),
+                     jpeg=self._frames[self._index % len(self._frames)])
+
+    def stop(self):
+        self._frames = []
+
+SOURCES = {
+    "picamera2": Picamera2Source,
+    "libcamera-vid": LibcameraVidSource,
+    "fake": FakeFrameSource,
+}
+
+def make_source(name=None, width=1920, height=1080):
+    """
+    Create a frame source
+    Args:
+        name: Key of SOURCES, or None for the first real camera source available
+    Returns:
+        Frame source, or None if no camera source can run here
+    """
+    if name is not None:
+        return SOURCES[name](width=width, height=height)
+    for source_class in (Picamera2Source, LibcameraVidSource):
+        if source_class.available():
+            return source_class(width=width, height=height)
+    return None
+
+class CameraService:
+    """Keeps a frame source running and hands out its newest frame"""
+    def __init__(self, source):
+        """
+        Args:
+            source: Frame source from make_source()
+        """
+        self.source = source
+        self.start_time = None
+        self.frames = 0
+        self._latest = None
+        self._cond = threading.Condition()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """
+        Start the source and the reader thread
+        Returns:
+            bool: True if frames are flowing
+        """
+        if self._running:
+            return True
+        begin = time.perf_counter()
+        try:
+            self.source.start()
+        except Exception as e:
+            print(f"Could not start the camera: {e}")
+            return False
+        self.start_time = time.perf_counter() - begin
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="camera", daemon=True)
+        self._thread.start()
+        print(f"Camera started in {self.start_time * 1000:.0f} ms")
+        return True
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.source.stop()
+
+    @property
+    def running(self):
+        return self._running
+
+    def latest(self):
+        """
+        Returns:
+            Frame: The newest frame, or None before the first one
+        """
+        with self._cond:
+            return self._latest
+
+    def capture(self, timeout=2.0):
+        """
+        Wait for the first frame that arrives after this call, so the photo
+        shows what is in front of the camera now
+        Returns:
+            Frame: The frame, or None if none arrived within timeout
+        """
+        requested = time.perf_counter()
+        deadline = requested + timeout
+        with self._cond:
+            while self._running and (self._latest is None or self._latest.timestamp <= requested):
+                remaining = deadline - time.perf_counter()
+                if remaining <= 0:
+                    return None
+                self._cond.wait(remaining)
+            if self._latest is None or self._latest.timestamp <= requested:
+                return None
+            return self._latest
+
+    def burst(self, count, timeout=2.0):
+        """
+        Collect the next count frames
+        Returns:
+            list: Frames arriving after this call, fewer if the camera stalls
+        """
+        frames = []
+        while len(frames) < count:
+            frame = self.capture(timeout)
+            if frame is None:
+                break
+            frames.append(frame)
+        return frames
+
+    def _run(self):
+        while self._running:
+            try:
+                frame = self.source.read()
+            except Exception as e:
+                print(f"Camera stopped: {e}")
+                with self._cond:
+                    self._running = False
+                    self._cond.notify_all()
+                return
+            with self._cond:
+                self._latest = frame
+                self.frames += 1
+                self._cond.notify_all()
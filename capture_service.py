@@ -0,0 +1,196 @@
+"""
+Always-open microphone with a pre-roll ring buffer
+
+Opening a PyAudio stream for every question costs device setup time and
+drops whatever the user says right after pressing Enter. CaptureService
+opens the input stream once in callback mode: PortAudio's own thread
+hands over each buffer and the callback copies it into a preallocated
+ring buffer, so capture keeps running while the app is busy with the
+camera or the network. A recording is then just a range of sample
+positions: chunks() hands out zero-copy memoryviews into the ring,
+starting up to ring_seconds in the past, so a recording can include
+audio from before it was triggered.
+
+Input overflows reported by PortAudio, frames lost between callbacks
+(from the ADC timestamps) and recordings that fell a whole ring behind
+are counted and returned by stats().
+
+A view stays valid until the ring wraps around onto it (ring_seconds
+later), which is far longer than a recording takes to consume.
+"""
+import time
+import threading
+import numpy as np
+import pyaudio
+
+class CaptureService:
+    """One warm 16-bit microphone stream feeding a ring buffer"""
+    def __init__(self, rate=16000, channels=1, chunk=1024, ring_seconds=30):
+        """
+        Args:
+            rate: Sample rate in Hz
+            channels: Number of channels
+            chunk: Frames per read; every view handed out is this long
+            ring_seconds: Seconds of audio the ring holds
+        """
+        self.rate = rate
+        self.channels = channels
+        self.chunk = chunk
+        self.format = pyaudio.paInt16
+        # Whole chunks only, so a chunk never wraps around the end of the ring
+        self.capacity = max(2, int(rate * ring_seconds) // chunk) * chunk
+        self._ring = np.zeros(self.capacity * channels, dtype=np.int16)
+        self._written = 0
+        self._cond = threading.Condition()
+        self._running = False
+        self._pa = None
+        self._stream = None
+        self._last_adc_time = None
+        self._last_frames = 0
+        self.open_time = None
+
+        self.callbacks = 0
+        self.input_overflows = 0
+        self.dropped_frames = 0
+        self.overruns = 0
+        self.max_callback_time = 0.0
+
+    def start(self):
+        """
+        Open the microphone and start filling the ring
+        Returns:
+            bool: True if the stream is running
+        """
+        if self._running:
+            return True
+        begin = time.perf_counter()
+        try:
+            self._pa = pyaudio.PyAudio()
+            self._running = True
+            self._stream = self._pa.open(format=self.format,
+                                         channels=self.channels,
+                                         rate=self.rate,
+                                         input=True,
+                                         frames_per_buffer=self.chunk,
+                                         stream_callback=self._callback)
+            self._stream.start_stream()
+        except Exception as e:
+            print(f"Could not open the microphone: {e}")
+            self._running = False
+            self._close_stream()
+            return False
+        self.open_time = time.perf_counter() - begin
+        print(f"Microphone open in {self.open_time * 1000:.0f} ms")
+        return True
+
+    def stop(self):
+        """Stop reading and release the microphone"""
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        self._close_stream()
+
+    @property
+    def running(self):
+        return self._running
+
+    def position(self):
+        """
+        Returns:
+            int: Frames captured so far; a recording starts at such a position
+        """
+        with self._cond:
+            return self._written
+
+    def stats(self):
+        """
+        Returns:
+            dict: Frames captured, callbacks, input overflows, dropped frames,
+                ring overruns and the slowest callback in ms
+        """
+        with self._cond:
+            return {
+                "frames": self._written,
+                "callbacks": self.callbacks,
+                "input_overflows": self.input_overflows,
+                "dropped_frames": self.dropped_frames,
+                "overruns": self.overruns,
+                "max_callback_ms": self.max_callback_time * 1000,
+            }
+
+    def chunks(self, start):
+        """
+        Yield the audio from frame position start on, one chunk at a time
+        Args:
+            start: Frame position, e.g. position() minus a pre-roll; rounded
+                down to a chunk boundary and clipped to what the ring holds
+        Returns:
+            Generator of memoryviews (bytes-like, chunk frames each) into the
+            ring; blocks until each chunk has been captured
+        """
+        pos = max(0, start) // self.chunk * self.chunk
+        while True:
+            with self._cond:
+                while self._written < pos + self.chunk and self._running:
+                    # PortAudio stops calling back if the device goes away
+                    if not self._cond.wait(timeout=1.0) and not self._active():
+                        self._running = False
+                if self._written < pos + self.chunk:
+                    raise RuntimeError("microphone stopped")
+                oldest = max(0, self._written - self.capacity + self.chunk)
+                if pos < oldest:
+                    # The consumer fell a whole ring behind; skip what was overwritten
+                    self.overruns += 1
+                    pos = oldest
+            offset = pos % self.capacity * self.channels
+            yield memoryview(self._ring[offset:offset + self.chunk * self.channels]).cast('B')
+            pos += self.chunk
+
+    def _callback(self, in_data, frame_count, time_info, status_flags):
+        """Runs on PortAudio's thread for every captured buffer; must not block"""
+        begin = time.perf_counter()
+        if not self._running:
+            return (None, pyaudio.paComplete)
+        dropped = 0
+        adc_time = (time_info or {}).get('input_buffer_adc_time') or 0.0
+        if adc_time and self._last_adc_time:
+            # A gap in the ADC timestamps beyond the previous buffer means lost frames
+            gap = int(round((adc_time - self._last_adc_time) * self.rate)) - self._last_frames
+            if gap > frame_count // 2:
+                dropped = gap
+        self._last_adc_time = adc_time
+        self._last_frames = frame_count
+
+        # Only this callback touches slots ahead of _written, so no lock for the copy
+        samples = np.frombuffer(in_data, dtype=np.int16)
+        offset = self._written % self.capacity * self.channels
+        first = min(len(samples), len(self._ring) - offset)
+        self._ring[offset:offset + first] = samples[:first]
+        self._ring[:len(samples) - first] = samples[first:]
+        with self._cond:
+            self._written += frame_count
+            self.callbacks += 1
+            if status_flags & pyaudio.paInputOverflow:
+                self.input_overflows += 1
+            self.dropped_frames += dropped
+            self.max_callback_time = max(self.max_callback_time, time.perf_counter() - begin)
+            self._cond.notify_all()
+        return (None, pyaudio.paContinue)
+
+    def _active(self):
+        try:
+            return self._stream is not None and self._stream.is_active()
+        except Exception:
+            return False
+
+    def _close_stream(self):
+        if self._stream is not None:
+            try:
+                self._stream.stop_stream()
+                self._stream.close()
+            except Exception as e:
+                print(f"Error closing the microphone: {e}")
+            self._stream = None
+        if self._pa is not None:
+            self._pa.terminate()
+            self._pa = None
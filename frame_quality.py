@@ -0,0 +1,134 @@
+"""
+Sharpness and exposure scoring of captured frames
+
+A blurry or badly exposed photo only shows up as a failed OCR answer
+after a full round trip. Frames are scored on the device instead:
+sharpness is the variance of the Laplacian of a downscaled grayscale
+copy (a 4-neighbour stencil computed with NumPy slicing), exposure the
+mean level and the share of crushed shadows and blown highlights. The
+capture path shoots a short burst, keeps the best frame and asks for a
+retake when even that one is below the thresholds. Score a photo with:
+
+    python frame_quality.py image/capture.jpg
+"""
+import io
+import sys
+import time
+import numpy as np
+from PIL import Image
+
+# Laplacian variance below which text is too blurred to read (at SCORE_EDGE)
+SHARPNESS_THRESHOLD = 100.0
+# Acceptable mean level and largest share of clipped pixels
+BRIGHTNESS_RANGE = (40, 215)
+MAX_CLIPPED = 0.25
+# Frames are scored at this long edge, so scores do not depend on resolution
+SCORE_EDGE = 960
+
+def grayscale(image, max_edge=SCORE_EDGE):
+    """
+    Args:
+        image: JPEG bytes, PIL image or H x W x 3 RGB array
+    Returns:
+        numpy.ndarray: float32 grayscale copy with a long edge of at most max_edge
+    """
+    if isinstance(image, np.ndarray):
+        image = Image.fromarray(image)
+    elif isinstance(image, (bytes, bytearray, memoryview)):
+        image = Image.open(io.BytesIO(image))
+        # Let the JPEG decoder scale down while decoding
+        image.draft('L', (max_edge, max_edge))
+    image = image.convert('L')
+    if max(image.size) > max_edge:
+        factor = int(np.ceil(max(image.size) / float(max_edge)))
+        image = image.reduce(factor)
+    return np.asarray(image, dtype=np.float32)
+
+def laplacian_variance(gray):
+    """
+    Returns:
+        float: Variance of the 4-neighbour Laplacian; higher means sharper
+    """
+    if gray.shape[0] < 3 or gray.shape[1] < 3:
+        return 0.0
+    lap = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+           - 4.0 * gray[1:-1, 1:-1])
+    return float(lap.var())
+
+def score_image(image):
+    """
+    Score one frame
+    Args:
+        image: JPEG bytes, PIL image or H x W x 3 RGB array
+    Returns:
+        dict: sharpness, brightness, dark and bright pixel shares, whether
+            sharpness and exposure pass, and the scoring time in ms
+    """
+    begin = time.perf_counter()
+    gray = grayscale(image)
+    sharpness = laplacian_variance(gray)
+    brightness = float(gray.mean())
+    dark = float(np.count_nonzero(gray < 10) / gray.size)
+    bright = float(np.count_nonzero(gray > 245) / gray.size)
+    return {
+        "sharpness": sharpness,
+        "brightness": brightness,
+        "dark": dark,
+        "bright": bright,
+        "sharp": sharpness >= SHARPNESS_THRESHOLD,
+        "exposed": (BRIGHTNESS_RANGE[0] <= brightness <= BRIGHTNESS_RANGE[1]
+                    and dark <= MAX_CLIPPED and bright <= MAX_CLIPPED),
+        "elapsed_ms": (time.perf_counter() - begin) * 1000,
+    }
+
+def pick_best(images):
+    """
+    Choose the frame of a burst to upload: well exposed first, then sharpest
+    Args:
+        images: List of JPEG bytes, PIL images or RGB arrays
+    Returns:
+        tuple: (index of the best frame, list of score dicts), or (None, []) if empty
+    """
+    scores = [score_image(image) for image in images]
+    if not scores:
+        return None, []
+    best = max(range(len(scores)),
+               key=lambda i: (scores[i]["exposed"], scores[i]["sharpness"]))
+    return best, scores
+
+def acceptable(score):
+    """Whether a frame is worth an OCR round trip"""
+    return score["sharp"] and score["exposed"]
+
+def problems(score):
+    """
+    Returns:
+        str: Why a frame is not acceptable, for the retake prompt
+    """
+    reasons = []
+    if not score["sharp"]:
+        reasons.append("blurry")
+    if score["brightness"] < BRIGHTNESS_RANGE[0] or score["dark"] > MAX_CLIPPED:
+        reasons.append("too dark")
+    if score["brightness"] > BRIGHTNESS_RANGE[1] or score["bright"] > MAX_CLIPPED:
+        reasons.append("too bright")
+    return " and ".join(reasons)
+
+def describe(score):
+    """One-line summary of a frame score"""
+    return (f"sharpness {score['sharpness']:.0f}, brightness {score['brightness']:.0f}, "
+            f"{score['dark']:.0%} dark, {score['bright']:.0%} bright "
+            f"({score['elapsed_ms']:.1f} ms)")
+
+def main():
+    if len(sys.argv) < 2:
+        print("Usage: python frame_quality.py <image.jpg> [...]")
+        return
+    for path in sys.argv[1:]:
+        with open(path, 'rb') as f:
+            score = score_image(f.read())
+        verdict = "ok" if acceptable(score) else problems(score)
+        print(f"{path}: {describe(score)} -> {verdict}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,118 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+# Connection pool defaults shared by every client class
+POOL_CONNECTIONS = 4    # Number of hosts with a cached connection pool
+POOL_MAXSIZE = 8        # Keep-alive connections kept per host
+POOL_BLOCK = False      # True makes POOL_MAXSIZE a hard per-host limit
+
+class PoolStats:
+    """Counters showing how often requests reused a kept-alive connection"""
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self._lock = threading.Lock()
+
+    def count_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def count_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    @property
+    def reused(self):
+        return max(0, self.requests - self.new_connections)
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: requests, new_connections, reused and reuse_ratio
+        """
+        with self._lock:
+            requests_made = self.requests
+            new_connections = self.new_connections
+        reused = max(0, requests_made - new_connections)
+        return {
+            "requests": requests_made,
+            "new_connections": new_connections,
+            "reused": reused,
+            "reuse_ratio": reused / requests_made if requests_made else 0.0,
+        }
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.new_connections = 0
+
+def _counting_pool(base):
+    class CountingConnectionPool(base):
+        stats = None
+
+        def _new_conn(self):
+            if self.stats is not None:
+                self.stats.count_connection()
+            return super()._new_conn()
+    return CountingConnectionPool
+
+class PooledHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter that counts requests and newly opened connections"""
+    def __init__(self, stats, **kwargs):
+        self.stats = stats
+        super().__init__(**kwargs)
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        pool_classes = {}
+        for scheme, base in (("http", HTTPConnectionPool), ("https", HTTPSConnectionPool)):
+            pool_class = _counting_pool(base)
+            pool_class.stats = self.stats
+            pool_classes[scheme] = pool_class
+        self.poolmanager.pool_classes_by_scheme = pool_classes
+
+    def send(self, request, **kwargs):
+        self.stats.count_request()
+        return super().send(request, **kwargs)
+
+def create_session(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                   pool_block=POOL_BLOCK, stats=None):
+    """
+    Create a keep-alive session backed by a counting connection pool
+    Args:
+        pool_connections: Number of hosts with a cached connection pool
+        pool_maxsize: Keep-alive connections kept per host
+        pool_block: Wait for a free connection instead of opening one past pool_maxsize
+        stats: PoolStats to record into, a new one if None
+    Returns:
+        requests.Session: Session with the pooled adapter mounted for http and https
+    """
+    session = requests.Session()
+    session.pool_stats = stats if stats is not None else PoolStats()
+    adapter = PooledHTTPAdapter(session.pool_stats, pool_connections=pool_connections,
+                                pool_maxsize=pool_maxsize, pool_block=pool_block)
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    return session
+
+_session = None
+_session_lock = threading.Lock()
+
+def get_session():
+    """
+    Return the process-wide pooled session, creating it on first use
+    """
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = create_session()
+        return _session
+
+def pool_stats():
+    """
+    Returns:
+        dict: Connection reuse counters of the shared session
+    """
+    return get_session().pool_stats.snapshot()
@@ -0,0 +1,114 @@
+"""
+Image preprocessing before upload
+
+The camera shoots 1920x1080 JPEGs. Before an OCR or vision query the
+page can be cropped out and straightened (document_crop), then the
+image is downscaled to the long edge the endpoint needs, optionally
+converted to grayscale with contrast normalisation (helps OCR on dim
+pages) and re-encoded at a tuned JPEG quality. Try a profile on a photo:
+
+    python image_preprocess.py image/capture.jpg
+"""
+import io
+import sys
+import time
+from PIL import Image, ImageOps
+from document_crop import crop_page
+
+class ImageProfile:
+    """How an endpoint wants its upload image prepared"""
+    def __init__(self, max_edge=None, grayscale=False, autocontrast=False, quality=85,
+                 crop_document=False, binarise=False):
+        """
+        Args:
+            max_edge: Longest side in pixels after downscaling, None keeps the size
+            grayscale: Convert to 8-bit grayscale
+            autocontrast: Stretch the histogram, clipping 1% at each end
+            quality: JPEG quality used for the re-encode
+            crop_document: Crop and straighten the page when one is found (needs opencv)
+            binarise: Threshold a cropped page to black and white
+        """
+        self.max_edge = max_edge
+        self.grayscale = grayscale
+        self.autocontrast = autocontrast
+        self.quality = quality
+        self.crop_document = crop_document
+        self.binarise = binarise
+
+# Printed text stays legible at 1600 px; grayscale drops the chroma planes and
+# cropping to the page drops the desk around it
+OCR_PROFILE = ImageProfile(max_edge=1600, grayscale=True, autocontrast=True, quality=85,
+                           crop_document=True)
+# Scene understanding models work on ~1 MP inputs anyway
+VISION_PROFILE = ImageProfile(max_edge=1024, quality=80)
+
+# Profile used for the image of each endpoint, None uploads it untouched
+DEFAULT_IMAGE_PROFILES = {
+    "/process-ocr-image-and-audio": OCR_PROFILE,
+    "/process-text-and-image": VISION_PROFILE,
+}
+
+def apply_profile(image, profile):
+    """
+    Returns:
+        PIL.Image.Image: image downscaled and converted according to profile
+    """
+    image = ImageOps.exif_transpose(image)
+    if profile.crop_document:
+        image, _ = crop_page(image, binary=profile.binarise)
+    if profile.max_edge and max(image.size) > profile.max_edge:
+        image = image.copy()
+        image.thumbnail((profile.max_edge, profile.max_edge), Image.LANCZOS)
+    if profile.grayscale:
+        image = image.convert('L')
+    elif image.mode not in ('RGB', 'L'):
+        image = image.convert('RGB')
+    if profile.autocontrast:
+        image = ImageOps.autocontrast(image, cutoff=1)
+    return image
+
+def preprocess_image(image_bytes, profile, log=True):
+    """
+    Prepare an image for upload, returning the original on any failure
+    Args:
+        image_bytes: Encoded image (JPEG from the camera)
+        profile: ImageProfile to apply, or None to leave the image untouched
+        log: Print the size and time of each preprocessed image
+    Returns:
+        bytes: JPEG to upload
+    """
+    if profile is None:
+        return image_bytes
+    start = time.perf_counter()
+    try:
+        with Image.open(io.BytesIO(image_bytes)) as image:
+            original_size = image.size
+            image = apply_profile(image, profile)
+            out = io.BytesIO()
+            image.save(out, format='JPEG', quality=profile.quality, optimize=True)
+    except Exception as e:
+        print(f"Image preprocessing failed, sending original: {e}")
+        return image_bytes
+
+    processed = out.getvalue()
+    elapsed = (time.perf_counter() - start) * 1000
+    if len(processed) >= len(image_bytes) and image.size == original_size:
+        # Nothing gained, keep the camera's own encoding
+        processed = image_bytes
+    if log:
+        print(f"Image {original_size[0]}x{original_size[1]} -> {image.size[0]}x{image.size[1]}: "
+              f"{len(image_bytes) / 1024:.1f} KB -> {len(processed) / 1024:.1f} KB in {elapsed:.1f} ms")
+    return processed
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python image_preprocess.py <image.jpg>")
+        return
+    with open(sys.argv[1], 'rb') as f:
+        image_bytes = f.read()
+    for name, profile in (("ocr", OCR_PROFILE), ("vision", VISION_PROFILE)):
+        print(f"{name}:")
+        preprocess_image(image_bytes, profile)
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,14 @@ from msrest.authentication import CognitiveServicesCredentials
 import time
 from datetime import datetime
 import subprocess
+import io
+import sys
+# document_crop.py lives in the repository root, one directory up from this script
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+try:
+    import document_crop
+except ImportError:
+    document_crop = None
 
 class VisionTextReader:
     def __init__(self):
@@ -79,12 +87,24 @@ class VisionTextReader:
             print(f"Error capturing image: {str(e)}")
             return None
 
-    def read_image(self, image_path):
-        """Read text from image and return results"""
+    def read_image(self, image_path, crop=True):
+        """
+        Read text from image and return results
+        Args:
+            image_path: Photo of the page
+            crop: Crop and straighten the page before sending it to Azure Read
+        """
         print(f"Reading text from image: {image_path}")
         
-        with open(image_path, "rb") as image_stream:
-            read_response = self.vision_client.read_in_stream(image_stream, raw=True)
+        with open(image_path, "rb") as f:
+            image_bytes = f.read()
+        if crop:
+            if document_crop is None or not document_crop.available():
+                print("Page cropping unavailable (needs document_crop.py and opencv-python), "
+                      "sending the whole photo")
+            else:
+                image_bytes = document_crop.crop_document(image_bytes)
+        read_response = self.vision_client.read_in_stream(io.BytesIO(image_bytes), raw=True)
             
         # Get operation ID
         operation_location = read_response.headers["Operation-Location"]
@@ -0,0 +1,233 @@
+"""
+Per-stage latency tracing
+
+Wrap a stage in span() to time it. Spans nest, so each interaction
+(one menu action) becomes a trace whose children show where the time
+went: camera, recording, upload and server, download, mixer start. Spans
+are appended to a JSONL file and summarised as p50/p95/p99 per stage.
+
+Tracing is off unless enabled with enable(path) or the LATENCY_TRACE
+environment variable; span() then returns a shared no-op context
+manager. Summarise a trace file with:
+
+    python latency_trace.py traces.jsonl
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import functools
+import threading
+import contextvars
+from collections import defaultdict
+
+# Span currently open in this thread or task: (trace id, span id)
+_current = contextvars.ContextVar("latency_trace_span", default=None)
+_tracer = None
+
+def percentile(values, pct):
+    """
+    Returns:
+        float: The pct-th percentile of values (nearest rank), or 0.0 if empty
+    """
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100.0 * len(ordered))) - 1))
+    return ordered[index]
+
+class Tracer:
+    """Writes finished spans to a JSONL file and keeps per-stage durations"""
+    def __init__(self, path):
+        self.path = path
+        self.durations = defaultdict(list)
+        self._lock = threading.Lock()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a', buffering=1)
+        # Converts perf_counter readings to wall-clock time
+        self._epoch = time.time() - time.perf_counter()
+
+    def record(self, name, start, duration, trace_id, span_id, parent_id, attrs):
+        entry = {
+            "trace": trace_id,
+            "span": span_id,
+            "parent": parent_id,
+            "name": name,
+            "ts": round(self._epoch + start, 6),
+            "duration_ms": round(duration * 1000, 3),
+            "thread": threading.current_thread().name,
+        }
+        entry.update(attrs)
+        line = json.dumps(entry, default=str)
+        with self._lock:
+            self.durations[name].append(duration)
+            self._file.write(line + "\n")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+class Span:
+    """Times one stage; use through span()"""
+    def __init__(self, tracer, name, attrs):
+        self.tracer = tracer
+        self.name = name
+        self.attrs = attrs
+
+    def set(self, **attrs):
+        """Attach attributes known only once the stage runs"""
+        self.attrs.update(attrs)
+
+    def __enter__(self):
+        parent = _current.get()
+        self.trace_id = parent[0] if parent else uuid.uuid4().hex[:16]
+        self.parent_id = parent[1] if parent else None
+        self.span_id = uuid.uuid4().hex[:16]
+        self._token = _current.set((self.trace_id, self.span_id))
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self.start
+        _current.reset(self._token)
+        if exc_type is not None:
+            self.attrs["error"] = exc_type.__name__
+        self.tracer.record(self.name, self.start, duration, self.trace_id, self.span_id,
+                           self.parent_id, self.attrs)
+        return False
+
+class _NoopSpan:
+    def set(self, **attrs):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+_NOOP = _NoopSpan()
+
+def enable(path="traces.jsonl"):
+    """Start writing spans to path"""
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+    _tracer = Tracer(path)
+    return _tracer
+
+def disable():
+    global _tracer
+    if _tracer is not None:
+        _tracer.close()
+        _tracer = None
+
+def enabled():
+    return _tracer is not None
+
+def span(name, **attrs):
+    """
+    Time the enclosed block as stage name
+    Returns:
+        Context manager yielding an object with set(**attrs)
+    """
+    if _tracer is None:
+        return _NOOP
+    return Span(_tracer, name, attrs)
+
+def traced(name):
+    """Decorator timing every call of the function as stage name"""
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return func(*args, **kwargs)
+            with Span(_tracer, name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+def record(name, start, duration, **attrs):
+    """
+    Record a stage timed elsewhere as a child of the current span
+    Args:
+        name: Stage name
+        start: perf_counter() reading when the stage began
+        duration: Length of the stage in seconds
+    """
+    if _tracer is None:
+        return
+    parent = _current.get()
+    trace_id = parent[0] if parent else uuid.uuid4().hex[:16]
+    _tracer.record(name, start, duration, trace_id, uuid.uuid4().hex[:16],
+                   parent[1] if parent else None, attrs)
+
+def bind(coro):
+    """
+    Carry the caller's current span into a coroutine run on another thread's loop
+    Returns:
+        Coroutine running coro as a child of the current span
+    """
+    parent = _current.get()
+    if _tracer is None or parent is None:
+        return coro
+
+    async def run():
+        _current.set(parent)
+        return await coro
+    return run()
+
+def summarize(durations):
+    """
+    Returns:
+        dict: stage -> {count, p50, p95, p99} in milliseconds
+    """
+    return {
+        name: {
+            "count": len(values),
+            "p50": percentile(values, 50) * 1000,
+            "p95": percentile(values, 95) * 1000,
+            "p99": percentile(values, 99) * 1000,
+        }
+        for name, values in durations.items()
+    }
+
+def print_summary(durations=None):
+    """Print the per-stage histogram of this run (or of the given durations)"""
+    if durations is None:
+        if _tracer is None:
+            return
+        with _tracer._lock:
+            durations = {name: list(values) for name, values in _tracer.durations.items()}
+    print(f"{'stage':<28} {'count':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for name, stats in sorted(summarize(durations).items()):
+        print(f"{name:<28} {stats['count']:>6} {stats['p50']:>9.1f} "
+              f"{stats['p95']:>9.1f} {stats['p99']:>9.1f}")
+
+def load_durations(path):
+    """
+    Returns:
+        dict: stage -> list of durations in seconds read from a JSONL trace file
+    """
+    durations = defaultdict(list)
+    with open(path, 'r') as f:
+        for line in f:
+            if line.strip():
+                entry = json.loads(line)
+                durations[entry["name"]].append(entry["duration_ms"] / 1000)
+    return durations
+
+if os.environ.get("LATENCY_TRACE"):
+    enable(os.environ["LATENCY_TRACE"])
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python latency_trace.py <traces.jsonl>")
+        return
+    print_summary(load_durations(sys.argv[1]))
+
+if __name__ == "__main__":
+    main()
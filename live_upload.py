@@ -0,0 +1,89 @@
+"""
+Upload query audio while it is still being recorded
+
+The recorder thread writes microphone chunks into a LiveAudioUpload and
+the event loop sends them to the server as a chunked HTTP request body
+behind a WAV header. The request body ends as soon as recording stops,
+so the server can start answering while it would otherwise still be
+waiting for the upload. Pass a LiveAudioUpload wherever the client
+methods take the query audio path.
+"""
+import time
+import queue
+import struct
+import asyncio
+
+# Placeholder RIFF/data sizes for recordings of unknown length (streaming WAV)
+UNKNOWN_SIZE = 0xFFFFFFFF
+
+def wav_header(rate, channels, sampwidth, nframes=None):
+    """
+    Build a WAV header for PCM data that follows it
+    Args:
+        rate: Sample rate in Hz
+        channels: Number of channels
+        sampwidth: Bytes per sample
+        nframes: Number of frames, None if not known in advance
+    Returns:
+        bytes: 44-byte RIFF/WAVE header
+    """
+    block_align = channels * sampwidth
+    if nframes is None:
+        data_size = riff_size = UNKNOWN_SIZE
+    else:
+        data_size = nframes * block_align
+        riff_size = 36 + data_size
+    return (b'RIFF' + struct.pack('<I', riff_size) + b'WAVE'
+            + b'fmt ' + struct.pack('<IHHIIHH', 16, 1, channels, rate, rate * block_align,
+                                    block_align, sampwidth * 8)
+            + b'data' + struct.pack('<I', data_size))
+
+class LiveAudioUpload:
+    """
+    Microphone chunks handed from the recording thread to an upload
+
+    write() and close() are called from the recorder; body() is consumed
+    by the event loop as the request body.
+    """
+    def __init__(self, rate=16000, channels=1, sampwidth=2, nframes=None):
+        """
+        Args:
+            rate: Sample rate in Hz
+            channels: Number of channels
+            sampwidth: Bytes per sample
+            nframes: Frames that will be recorded, None if recording may stop at any time
+        """
+        self.header = wav_header(rate, channels, sampwidth, nframes)
+        self.bytes_sent = 0
+        self.finished_time = None
+        # Answer bytes received for this upload, set by the client when the request ends
+        self.bytes_received = 0
+        self._chunks = queue.Queue()
+
+    def write(self, chunk):
+        """Queue one chunk of PCM frames for upload; it must not change after this call"""
+        self._chunks.put(chunk)
+
+    def close(self):
+        """Mark the end of the recording, letting the request body finish"""
+        self._chunks.put(None)
+
+    def abort(self, reason="recording cancelled"):
+        """End the upload with an error so the request fails instead of completing"""
+        self._chunks.put(RuntimeError(reason))
+
+    async def body(self):
+        """Yield the WAV header and then each chunk as the recorder produces it"""
+        self.bytes_sent = len(self.header)
+        yield self.header
+        while True:
+            # The recorder always closes the upload, so a waiting worker never leaks
+            chunk = await asyncio.to_thread(self._chunks.get)
+            if chunk is None:
+                break
+            if isinstance(chunk, Exception):
+                raise chunk
+            self.bytes_sent += len(chunk)
+            yield chunk
+        self.finished_time = time.perf_counter()
+
@@ -0,0 +1,290 @@
+"""
+Multi-device load generator for the RAG reader server
+
+Simulates N reader devices, each with its own AsyncAPIClient and
+connection pool, all on one event loop. Every device repeatedly picks an
+action by weight (audiobook sentence, voice, OCR or vision query), waits
+a random think time and goes again. Throughput, error rate and latency
+percentiles are printed per interval and per action at the end:
+
+    python load_generator.py --devices 20 --duration 60 --mix sentence=70,voice=10,ocr=10,vision=10
+    python load_generator.py --stub --stub-latency 0.2 --devices 50
+
+Without --stub the devices target --url, which has to be given
+explicitly. Each device reads its own synthetic book (load-device-<n>)
+unless --book-id is passed, because every sentence request advances the
+server's reading position for that book.
+"""
+import os
+import copy
+import json
+import time
+import random
+import shutil
+import asyncio
+import argparse
+import tempfile
+from collections import defaultdict
+from PIL import Image
+from async_api_client import AsyncAPIClient
+from image_preprocess import OCR_PROFILE, VISION_PROFILE, preprocess_image
+from request_policy import DEFAULT_POLICIES, ResilienceStats
+from http_session import PoolStats
+from latency_trace import percentile
+from stub_server import StubServer, make_wav
+
+ACTIONS = ("sentence", "voice", "ocr", "vision")
+DEFAULT_MIX = "sentence=70,voice=10,ocr=10,vision=10"
+
+def parse_mix(text):
+    """
+    Parse "sentence=70,voice=10" into action weights
+    Returns:
+        dict: action -> weight, or None if the mix is invalid
+    """
+    mix = {}
+    for item in text.split(','):
+        name, _, weight = item.partition('=')
+        name = name.strip()
+        if name not in ACTIONS:
+            print(f"Unknown action in mix: {name} (choose from {', '.join(ACTIONS)})")
+            return None
+        try:
+            mix[name] = float(weight)
+        except ValueError:
+            print(f"Invalid weight for {name}: {weight}")
+            return None
+    if not any(w > 0 for w in mix.values()):
+        print("Mix needs at least one positive weight")
+        return None
+    return mix
+
+class LoadStats:
+    """Latencies and errors per action, for the current interval and the whole run"""
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.interval = defaultdict(list)
+        self.interval_errors = defaultdict(int)
+        self.total = defaultdict(list)
+        self.total_errors = defaultdict(int)
+
+    def record(self, action, latency, ok):
+        if ok:
+            self.interval[action].append(latency)
+            self.total[action].append(latency)
+        else:
+            self.interval_errors[action] += 1
+            self.total_errors[action] += 1
+
+    def take_interval(self):
+        """Return and reset the (latencies, errors) of the current interval"""
+        latencies, errors = self.interval, self.interval_errors
+        self.interval = defaultdict(list)
+        self.interval_errors = defaultdict(int)
+        return latencies, errors
+
+def summary_row(latencies, errors, elapsed):
+    """
+    Returns:
+        dict: ops, errors, ops/s, error rate and p50/p95/p99 in ms
+    """
+    ok = len(latencies)
+    total = ok + errors
+    return {
+        "ops": total,
+        "errors": errors,
+        "ops_per_s": total / elapsed if elapsed else 0.0,
+        "error_rate": errors / total if total else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p95_ms": percentile(latencies, 95) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+def print_row(label, row):
+    print(f"{label:<14} {row['ops']:>7} ops {row['ops_per_s']:>8.1f}/s  "
+          f"err {row['error_rate']:>6.1%}  p50 {row['p50_ms']:>8.1f}  "
+          f"p95 {row['p95_ms']:>8.1f}  p99 {row['p99_ms']:>8.1f} ms")
+
+def make_inputs(work_dir, query_seconds):
+    """
+    Write the query WAV and the images every device uploads
+
+    The camera-sized JPEG is preprocessed here, once per endpoint profile,
+    and the devices upload it as is, so the load measures the server rather
+    than this process re-encoding the same photo for every request.
+    Returns:
+        tuple: (audio path, {action: image path} for the "ocr" and "vision" actions)
+    """
+    audio_path = os.path.join(work_dir, "query.wav")
+    with open(audio_path, 'wb') as f:
+        f.write(make_wav(query_seconds))
+    image_path = os.path.join(work_dir, "image.jpg")
+    Image.effect_noise((1920, 1080), 40).convert('RGB').save(image_path, quality=90)
+    with open(image_path, 'rb') as f:
+        camera_bytes = f.read()
+    image_paths = {}
+    for action, profile in (("ocr", OCR_PROFILE), ("vision", VISION_PROFILE)):
+        image_paths[action] = os.path.join(work_dir, f"{action}_image.jpg")
+        with open(image_paths[action], 'wb') as f:
+            f.write(preprocess_image(camera_bytes, profile))
+    return audio_path, image_paths
+
+async def run_action(client, action, audio_path, image_paths, book_id):
+    """
+    Perform one device action
+    Args:
+        image_paths: Preprocessed image for the "ocr" and "vision" actions
+    Returns:
+        bool: True if it succeeded
+    """
+    if action == "sentence":
+        audio_url = await client.get_next_sentence(book_id)
+        if not audio_url:
+            return False
+        return await client.download(audio_url) is not None
+    if action == "voice":
+        return await client.send_voice_query(audio_path) is not None
+    if action == "ocr":
+        return await client.send_ocr_query(image_paths["ocr"], audio_path) is not None
+    return await client.process_vision_query(image_paths["vision"], audio_path) is not None
+
+async def device(index, client, mix, deadline, stats, inputs, args):
+    """One simulated reader device: pick, run, think, repeat until the deadline"""
+    rng = random.Random(index)
+    actions = list(mix)
+    weights = [mix[a] for a in actions]
+    book_id = args.book_id or f"load-device-{index}"
+    # Stagger start-up across the ramp period
+    await asyncio.sleep(args.ramp * index / max(1, args.devices))
+    while time.perf_counter() < deadline:
+        action = rng.choices(actions, weights)[0]
+        start = time.perf_counter()
+        try:
+            ok = await run_action(client, action, *inputs, book_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Device {index} {action} failed: {e}")
+            ok = False
+        stats.record(action, time.perf_counter() - start, ok)
+        if args.think:
+            await asyncio.sleep(rng.expovariate(1.0 / args.think))
+
+async def reporter(stats, interval, deadline, output):
+    """Print one line per interval with the totals across actions"""
+    last = time.perf_counter()
+    while True:
+        await asyncio.sleep(max(0.0, min(interval, deadline - time.perf_counter())))
+        now = time.perf_counter()
+        latencies, errors = stats.take_interval()
+        row = summary_row([l for values in latencies.values() for l in values],
+                          sum(errors.values()), now - last)
+        print_row(f"t={now - stats.start:6.1f}s", row)
+        if output:
+            row.update(t=round(now - stats.start, 3),
+                       actions={a: summary_row(latencies[a], errors[a], now - last)
+                                for a in set(latencies) | set(errors)})
+            output.write(json.dumps(row) + "\n")
+            output.flush()
+        last = now
+        if now >= deadline:
+            return
+
+async def run_load(args, mix, base_url, inputs, work_dir):
+    pool_stats = PoolStats()
+    resilience = ResilienceStats()
+    policies = {}
+    if args.retries is not None:
+        for endpoint, policy in DEFAULT_POLICIES.items():
+            policies[endpoint] = copy.copy(policy)
+            policies[endpoint].retries = args.retries
+
+    clients = []
+    for i in range(args.devices):
+        temp_dir = os.path.join(work_dir, f"device-{i}")
+        # Images were preprocessed once by make_inputs
+        clients.append(AsyncAPIClient(base_url, temp_dir=temp_dir, stats=pool_stats,
+                                      image_profiles={}, policies=policies,
+                                      resilience=resilience, log_transfers=False))
+
+    stats = LoadStats()
+    deadline = time.perf_counter() + args.duration
+    output = open(args.output, 'a') if args.output else None
+    try:
+        print(f"{args.devices} devices for {args.duration:.0f} s against {base_url}, mix {args.mix}")
+        tasks = [asyncio.ensure_future(device(i, c, mix, deadline, stats, inputs, args))
+                 for i, c in enumerate(clients)]
+        await reporter(stats, args.interval, deadline, output)
+        # Let in-flight actions finish, then cut off stragglers
+        done, pending = await asyncio.wait(tasks, timeout=args.drain)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    finally:
+        for client in clients:
+            await client.close()
+        if output:
+            output.close()
+
+    elapsed = time.perf_counter() - stats.start
+    print("\nTotals")
+    for action in ACTIONS:
+        if action in stats.total or action in stats.total_errors:
+            print_row(action, summary_row(stats.total[action], stats.total_errors[action], elapsed))
+    print_row("all", summary_row([l for values in stats.total.values() for l in values],
+                                 sum(stats.total_errors.values()), elapsed))
+    connections = pool_stats.snapshot()
+    print(f"Connections: {connections['requests']} requests, "
+          f"{connections['new_connections']} opened")
+    for endpoint, counts in sorted(resilience.snapshot().items()):
+        print(f"{endpoint}: {counts['timeouts']} timeouts, {counts['retries']} retries, "
+              f"{counts['failures']} failed")
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulate many reader devices against the server")
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument('--url', help="Server to load")
+    target.add_argument('--stub', action='store_true', help="Start a local stub server and load it")
+    parser.add_argument('--book-id',
+                        help="Book every device reads, advancing its shared reading position; "
+                             "by default each device reads its own synthetic book")
+    parser.add_argument('--devices', type=int, default=10, help="Concurrent simulated devices")
+    parser.add_argument('--duration', type=float, default=30.0, help="Seconds of load")
+    parser.add_argument('--ramp', type=float, default=5.0, help="Seconds over which devices start")
+    parser.add_argument('--think', type=float, default=1.0, help="Mean pause between actions (s)")
+    parser.add_argument('--mix', default=DEFAULT_MIX, help="Action weights, e.g. " + DEFAULT_MIX)
+    parser.add_argument('--interval', type=float, default=5.0, help="Seconds per report line")
+    parser.add_argument('--drain', type=float, default=10.0,
+                        help="Seconds to let in-flight actions finish after the run")
+    parser.add_argument('--retries', type=int, default=None,
+                        help="Override the retry count of every endpoint (0 shows raw errors)")
+    parser.add_argument('--query-seconds', type=float, default=3.0, help="Length of the query audio")
+    parser.add_argument('--output', help="Append per-interval results as JSONL to this file")
+    parser.add_argument('--stub-latency', type=float, default=0.1)
+    parser.add_argument('--stub-error-ratio', type=float, default=0.0)
+    args = parser.parse_args()
+
+    mix = parse_mix(args.mix)
+    if mix is None:
+        return
+
+    server = None
+    base_url = args.url
+    if args.stub:
+        server = StubServer(sentences=1000000, latency=args.stub_latency,
+                            error_ratio=args.stub_error_ratio).start()
+        base_url = server.url
+
+    work_dir = tempfile.mkdtemp(prefix="load-")
+    try:
+        inputs = make_inputs(work_dir, args.query_seconds)
+        asyncio.run(run_load(args, mix, base_url, inputs, work_dir))
+    except KeyboardInterrupt:
+        print("\nLoad stopped")
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        if server is not None:
+            server.stop()
+
+if __name__ == "__main__":
+    main()
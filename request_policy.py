@@ -0,0 +1,299 @@
+"""
+Per-endpoint deadlines, retries and hedged requests
+
+Every server call runs under a RequestPolicy: connect/read/total
+timeouts, a number of retries with full-jitter exponential backoff and,
+for idempotent calls, an optional hedge that sends a duplicate request
+when the first one is slower than hedge_after and keeps whichever
+answers first. ResilienceStats counts how often each mechanism fired.
+"""
+import time
+import queue
+import random
+import asyncio
+import threading
+import aiohttp
+import requests
+
+# Statuses worth another attempt: overload and gateway errors
+RETRY_STATUSES = (429, 502, 503, 504)
+
+class RetryableError(Exception):
+    """An attempt failed in a way that may succeed if repeated"""
+
+class RequestPolicy:
+    """Deadlines, retries and hedging for one endpoint"""
+    def __init__(self, connect_timeout=5.0, read_timeout=30.0, total_timeout=None, retries=2,
+                 backoff_base=0.25, backoff_max=4.0, idempotent=True, hedge_after=None):
+        """
+        Args:
+            connect_timeout: Seconds allowed to open a connection
+            read_timeout: Longest silence allowed while waiting for response data
+            total_timeout: Deadline for the whole request, None for no limit
+            retries: Extra attempts after the first one fails
+            backoff_base: Backoff ceiling before the first retry, doubled per retry
+            backoff_max: Largest backoff ceiling
+            idempotent: Whether repeating the request is harmless; other requests
+                are only retried when the connection could not be opened
+            hedge_after: Seconds before a duplicate request is sent, None disables hedging
+        """
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.total_timeout = total_timeout
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.idempotent = idempotent
+        self.hedge_after = hedge_after if idempotent else None
+
+    def client_timeout(self):
+        """
+        Returns:
+            aiohttp.ClientTimeout: The policy's deadlines for AsyncAPIClient
+        """
+        return aiohttp.ClientTimeout(total=self.total_timeout, sock_connect=self.connect_timeout,
+                                     sock_read=self.read_timeout)
+
+    def requests_timeout(self):
+        """
+        Returns:
+            tuple: (connect, read) timeout for requests
+        """
+        return (self.connect_timeout, self.read_timeout)
+
+    def backoff(self, retry):
+        """
+        Returns:
+            float: Seconds to sleep before retry number retry (0-based), with full jitter
+        """
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** retry))
+
+# The server advances its reading position on every /next-sentence call, so
+# a hedge, or a retry of a request the server may already have handled (read
+# timeout, 5xx), could skip sentences; only failed connects are repeated
+DEFAULT_POLICIES = {
+    "/next-sentence": RequestPolicy(connect_timeout=3.0, read_timeout=10.0, total_timeout=15.0,
+                                    idempotent=False),
+    "/next-sentences": RequestPolicy(connect_timeout=3.0, read_timeout=10.0, total_timeout=15.0,
+                                     idempotent=False),
+    # Answers take a while to generate and stream back, never repeat an upload
+    "/rag-voice-assistant": RequestPolicy(read_timeout=60.0, retries=1, idempotent=False),
+    "/process-ocr-image-and-audio": RequestPolicy(read_timeout=60.0, retries=1, idempotent=False),
+    "/process-text-and-image": RequestPolicy(read_timeout=60.0, retries=1, idempotent=False),
+    # Sentence clip downloads
+    "audio": RequestPolicy(connect_timeout=3.0, read_timeout=15.0, retries=3, hedge_after=1.0),
+}
+
+def get_policy(endpoint, policies=None):
+    """
+    Returns:
+        RequestPolicy: The policy for endpoint, or a default one if it has none
+    """
+    policies = DEFAULT_POLICIES if policies is None else policies
+    return policies.get(endpoint) or RequestPolicy()
+
+class ResilienceStats:
+    """Per-endpoint counters of timeouts, retries, hedges and failures"""
+    EVENTS = ("calls", "timeouts", "retries", "hedges", "hedge_wins", "failures")
+
+    def __init__(self):
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def count(self, endpoint, event):
+        with self._lock:
+            counts = self._counts.setdefault(endpoint, dict.fromkeys(self.EVENTS, 0))
+            counts[event] += 1
+
+    def snapshot(self):
+        """
+        Returns:
+            dict: endpoint -> {calls, timeouts, retries, hedges, hedge_wins, failures}
+        """
+        with self._lock:
+            return {endpoint: dict(counts) for endpoint, counts in self._counts.items()}
+
+    def reset(self):
+        with self._lock:
+            self._counts.clear()
+
+_stats = ResilienceStats()
+
+def get_resilience_stats():
+    """Return the process-wide ResilienceStats"""
+    return _stats
+
+def resilience_stats():
+    """
+    Returns:
+        dict: Snapshot of the process-wide counters
+    """
+    return _stats.snapshot()
+
+def check_status(status):
+    """Raise RetryableError for statuses that are worth another attempt"""
+    if status in RETRY_STATUSES:
+        raise RetryableError(f"server returned {status}")
+
+def _is_timeout(exc):
+    return isinstance(exc, (asyncio.TimeoutError, requests.exceptions.Timeout))
+
+def _safe_to_retry(policy, exc):
+    """A request that never reached the server can always be repeated"""
+    if policy.idempotent:
+        return True
+    return isinstance(exc, (aiohttp.ClientConnectorError, aiohttp.ConnectionTimeoutError,
+                            requests.exceptions.ConnectTimeout))
+
+async def call_async(endpoint, policy, attempt, stats=None, hedge=True, can_retry=None):
+    """
+    Run attempt under policy on the event loop
+    Args:
+        endpoint: Name the counters are recorded under
+        policy: RequestPolicy to apply
+        attempt: Coroutine function making one request; raises on failure
+        stats: ResilienceStats to record into, the shared one if None
+        hedge: Allow a hedged duplicate if the policy has one
+        can_retry: Optional callable returning False once a retry is unsafe,
+            e.g. after part of the response was handed on
+    Returns:
+        Result of the first successful attempt
+    """
+    stats = stats if stats is not None else _stats
+    stats.count(endpoint, "calls")
+    for retry in range(policy.retries + 1):
+        try:
+            if hedge and policy.hedge_after is not None:
+                return await _hedged_async(endpoint, policy, attempt, stats)
+            return await attempt()
+        except asyncio.CancelledError:
+            raise
+        except (RetryableError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            if _is_timeout(e):
+                stats.count(endpoint, "timeouts")
+            if (retry == policy.retries or not _safe_to_retry(policy, e)
+                    or (can_retry is not None and not can_retry())):
+                stats.count(endpoint, "failures")
+                raise
+            stats.count(endpoint, "retries")
+            delay = policy.backoff(retry)
+            print(f"{endpoint} failed ({e or type(e).__name__}), retrying in {delay:.2f} s")
+            await asyncio.sleep(delay)
+
+async def _hedged_async(endpoint, policy, attempt, stats):
+    first = asyncio.ensure_future(attempt())
+    pending = {first}
+    try:
+        done, pending = await asyncio.wait(pending, timeout=policy.hedge_after)
+        if done:
+            return first.result()
+        stats.count(endpoint, "hedges")
+        second = asyncio.ensure_future(attempt())
+        pending.add(second)
+        error = None
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        stats.count(endpoint, "hedge_wins")
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
+
+def call_sync(endpoint, policy, attempt, stats=None, hedge=True, cancel_event=None, discard=None):
+    """
+    Run attempt under policy on the calling thread
+    Args:
+        endpoint: Name the counters are recorded under
+        policy: RequestPolicy to apply; pass policy.requests_timeout() to requests
+        attempt: Callable (cancel_event) making one request; raises on failure
+        stats: ResilienceStats to record into, the shared one if None
+        hedge: Allow a hedged duplicate if the policy has one
+        cancel_event: Optional threading.Event aborting the call when set
+        discard: Optional callable receiving the result of a losing hedge, for cleanup
+    Returns:
+        Result of the first successful attempt
+    """
+    stats = stats if stats is not None else _stats
+    stats.count(endpoint, "calls")
+    for retry in range(policy.retries + 1):
+        try:
+            if hedge and policy.hedge_after is not None:
+                return _hedged_sync(endpoint, policy, attempt, stats, cancel_event, discard)
+            return attempt(cancel_event)
+        except (RetryableError, requests.exceptions.RequestException) as e:
+            if _is_timeout(e):
+                stats.count(endpoint, "timeouts")
+            cancelled = cancel_event is not None and cancel_event.is_set()
+            if retry == policy.retries or not _safe_to_retry(policy, e) or cancelled:
+                stats.count(endpoint, "failures")
+                raise
+            stats.count(endpoint, "retries")
+            delay = policy.backoff(retry)
+            print(f"{endpoint} failed ({e}), retrying in {delay:.2f} s")
+            if cancel_event is not None:
+                if cancel_event.wait(delay):
+                    raise
+            else:
+                time.sleep(delay)
+
+def _hedged_sync(endpoint, policy, attempt, stats, cancel_event, discard):
+    results = queue.Queue()
+    events = []
+
+    def launch():
+        event = threading.Event()
+        events.append(event)
+
+        def run():
+            try:
+                results.put((event, attempt(event), None))
+            except Exception as e:
+                results.put((event, None, e))
+        threading.Thread(target=run, name=f"hedge-{endpoint}", daemon=True).start()
+        return event
+
+    first = launch()
+    deadline = time.monotonic() + policy.hedge_after
+    outstanding = 1
+    error = None
+    while outstanding:
+        if cancel_event is not None and cancel_event.is_set():
+            for event in events:
+                event.set()
+        timeout = 0.1
+        if len(events) == 1:
+            timeout = max(0.0, min(timeout, deadline - time.monotonic()))
+        try:
+            event, result, exc = results.get(timeout=timeout)
+        except queue.Empty:
+            if len(events) == 1 and time.monotonic() >= deadline:
+                stats.count(endpoint, "hedges")
+                launch()
+                outstanding += 1
+            continue
+        outstanding -= 1
+        if exc is not None:
+            error = exc
+            continue
+        if event is not first:
+            stats.count(endpoint, "hedge_wins")
+        # Stop the loser and clean up whatever it still produces
+        for other in events:
+            if other is not event:
+                other.set()
+        if outstanding and discard is not None:
+            threading.Thread(target=_discard_late, args=(results, outstanding, discard),
+                             daemon=True).start()
+        return result
+    raise error
+
+def _discard_late(results, outstanding, discard):
+    for _ in range(outstanding):
+        _, result, exc = results.get()
+        if exc is None and result is not None:
+            discard(result)
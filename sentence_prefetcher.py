@@ -0,0 +1,244 @@
+import os
+import json
+import threading
+from collections import deque
+
+class SentencePrefetcher:
+    """
+    Resolve and download upcoming audiobook sentences in the background
+
+    While the current sentence plays, a worker thread asks the server for the
+    next sentence URLs and downloads their clips, so pressing Enter only has
+    to start playback. The server advances its reading position for every
+    sentence it hands out, so the ones that were prefetched but never played
+    are returned by leftovers(), kept on disk with save_pending() and passed
+    as pending to the next prefetcher, which plays them before resolving new
+    ones.
+    """
+    def __init__(self, resolve_next, download, depth=3, max_bytes=8 * 1024 * 1024,
+                 retry_delay=1.0, max_failures=5, resolve_batch=None, pending=None):
+        """
+        Args:
+            resolve_next: Callable returning the next audio URL, or None
+            download: Callable (url, cancel_event) returning a local file path, or None
+            depth: Maximum number of clips kept ready ahead of playback
+            max_bytes: Maximum total size of clips kept ready ahead of playback
+            retry_delay: Seconds to wait after a failed resolve or download
+            max_failures: Consecutive failures before the prefetcher gives up
+            resolve_batch: Optional callable (count) returning a list of the next URLs
+                (or None on failure),
+                used instead of resolve_next to resolve several sentences per request
+            pending: (audio_url, file_path or None) tuples from an earlier prefetcher's
+                leftovers(), played before any new sentence is resolved
+        """
+        self.resolve_next = resolve_next
+        self.download = download
+        self.depth = max(1, depth)
+        self.max_bytes = max_bytes
+        self.retry_delay = retry_delay
+        self.max_failures = max_failures
+        self.resolve_batch = resolve_batch
+
+        # URLs resolved in a batch but not downloaded yet
+        self._resolved = deque()
+
+        self._ready = deque()
+        self._ready_bytes = 0
+        self._cond = threading.Condition()
+        self._stop = threading.Event()
+        self._finished = False
+        self._end_of_book = False
+        self._thread = None
+
+        for audio_url, file_path in pending or ():
+            # Once one clip has to be downloaded again, later ones queue behind it
+            if not self._resolved and file_path and os.path.exists(file_path):
+                size = os.path.getsize(file_path)
+                self._ready.append((audio_url, file_path, size))
+                self._ready_bytes += size
+            else:
+                self._resolved.append(audio_url)
+
+    def start(self):
+        """Start the background worker"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="sentence-prefetcher", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        """
+        Cancel the background worker and wait for it to exit
+        Downloads abort as soon as the worker is cancelled, but a resolve request
+        runs until it returns, so leftovers() is only complete once this returns
+        without a timeout.
+        Args:
+            timeout: Seconds to wait for the worker, or None to wait until it exits
+        """
+        self._stop.set()
+        with self._cond:
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def next_clip(self, timeout=None):
+        """
+        Take the next ready clip, waiting for it if necessary
+        Args:
+            timeout: Seconds to wait, or None to wait until a clip is ready
+        Returns:
+            tuple: (audio_url, file_path), or None if nothing arrived in time
+        """
+        with self._cond:
+            self._cond.wait_for(lambda: self._ready or self._finished or self._stop.is_set(),
+                                timeout)
+            if not self._ready:
+                return None
+            url, path, size = self._ready.popleft()
+            self._ready_bytes -= size
+            self._cond.notify_all()
+            return url, path
+
+    def give_back(self, clips):
+        """
+        Return clips taken with next_clip() that were not played to the end;
+        next_clip() hands them out again before any other clip
+        Args:
+            clips: (audio_url, file_path) tuples in reading order
+        """
+        with self._cond:
+            for audio_url, file_path in reversed(clips):
+                size = os.path.getsize(file_path) if os.path.exists(file_path) else 0
+                self._ready.appendleft((audio_url, file_path, size))
+                self._ready_bytes += size
+            self._cond.notify_all()
+
+    def leftovers(self):
+        """
+        Sentences the server already handed out that were not played, in reading order
+        Call after stop() and pass the result as pending to the next prefetcher,
+        or keep it with save_pending().
+        Returns:
+            list: (audio_url, file_path or None) tuples; None where the clip
+                was not downloaded yet
+        """
+        with self._cond:
+            return ([(url, path) for url, path, _ in self._ready] +
+                    [(url, None) for url in self._resolved])
+
+    @property
+    def finished(self):
+        """True once the worker has exited and every ready clip was taken"""
+        with self._cond:
+            return self._finished and not self._ready
+
+    def _has_room(self):
+        if self._stop.is_set():
+            return True
+        if not self._ready:
+            # Always allow one clip, even if it alone exceeds the byte budget
+            return True
+        return len(self._ready) < self.depth and self._ready_bytes < self.max_bytes
+
+    def _next_url(self):
+        if self._resolved:
+            return self._resolved.popleft()
+        if self.resolve_batch is None:
+            return self.resolve_next()
+        with self._cond:
+            count = max(1, self.depth - len(self._ready))
+        urls = self.resolve_batch(count)
+        # An empty list (unlike None) means the server has no more sentences
+        self._end_of_book = urls == []
+        self._resolved.extend(urls or [])
+        return self._resolved.popleft() if self._resolved else None
+
+    def _run(self):
+        failures = 0
+        try:
+            while not self._stop.is_set():
+                with self._cond:
+                    self._cond.wait_for(self._has_room)
+                if self._stop.is_set():
+                    break
+
+                audio_url = self._next_url()
+                if audio_url is None and self._end_of_book:
+                    break
+                file_path = None
+                if audio_url and not self._stop.is_set():
+                    file_path = self.download(audio_url, self._stop)
+
+                if not file_path and audio_url:
+                    # Try the same sentence again rather than skipping it
+                    self._resolved.appendleft(audio_url)
+                if self._stop.is_set() and not file_path:
+                    break
+                if not file_path:
+                    failures += 1
+                    if failures >= self.max_failures:
+                        print("Prefetch stopped after repeated failures")
+                        break
+                    self._stop.wait(self.retry_delay)
+                    continue
+
+                failures = 0
+                size = os.path.getsize(file_path)
+                with self._cond:
+                    self._ready.append((audio_url, file_path, size))
+                    self._ready_bytes += size
+                    self._cond.notify_all()
+        except Exception as e:
+            print(f"Prefetch error: {e}")
+        finally:
+            with self._cond:
+                self._finished = True
+                self._cond.notify_all()
+
+def load_pending(path, book_id):
+    """
+    Read the sentences saved for a book by save_pending()
+    Args:
+        path: JSON file holding the pending sentences of every book
+        book_id: Book to load
+    Returns:
+        list: (audio_url, file_path or None) tuples, empty if nothing was saved
+    """
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, 'r') as f:
+            return [tuple(entry) for entry in json.load(f).get(book_id, [])]
+    except Exception as e:
+        print(f"Ignoring unreadable pending sentences: {e}")
+        return []
+
+def save_pending(path, book_id, pending):
+    """
+    Store a book's unplayed sentences so the next session plays them first
+    Args:
+        path: JSON file holding the pending sentences of every book
+        book_id: Book the sentences belong to
+        pending: (audio_url, file_path or None) tuples from leftovers()
+    """
+    books = {}
+    if os.path.exists(path):
+        try:
+            with open(path, 'r') as f:
+                books = json.load(f)
+        except Exception as e:
+            print(f"Replacing unreadable pending sentences: {e}")
+    if pending:
+        books[book_id] = [list(entry) for entry in pending]
+    else:
+        books.pop(book_id, None)
+    try:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(books, f)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        print(f"Could not save pending sentences: {e}")
@@ -1,236 +1,567 @@
 import os
 import pyaudio
-import wave
-import pygame
-import requests
-import json
+import threading
 import time
 import subprocess
+import contextvars
 from datetime import datetime
-from urllib.parse import unquote
+from http_session import get_session, pool_stats
+from async_api_client import (AsyncAPIClient, get_event_loop_thread,
+                              DEFAULT_BASE_URL, DEFAULT_BOOK_ID)
+from audio_cache import AudioCache
+from audio_output import get_output_engine
+from streaming_audio import (StreamingAudioBuffer, play_buffer, play_stream,
+                             content_length_of)
+from sentence_prefetcher import SentencePrefetcher, load_pending, save_pending
+from book_downloader import BookDownloader, OfflineBook
+from live_upload import LiveAudioUpload, wav_header
+from request_policy import get_policy, resilience_stats
+from vad import Endpointer
+from capture_service import CaptureService
+from audio_conditioning import condition_wav, describe
+from camera_service import CameraService, make_source
+import frame_quality
+import latency_trace
+from latency_trace import traced
+
+# Audiobook read-ahead: number of clips and bytes kept ready ahead of playback
+PREFETCH_DEPTH = 3
+PREFETCH_MAX_BYTES = 8 * 1024 * 1024
+
+# Sentences the server handed out but were not played, kept per book next to
+# the audio cache index so they survive leaving the player and the application
+PENDING_SENTENCES_FILE = "pending.json"
+
+# Upload query audio while it is being recorded instead of after. The body is
+# chunked behind a WAV header of unknown length; if the server turns it down
+# before answering, the finished recording is sent again as a normal upload.
+LIVE_UPLOAD = True
+
+# Stop recording when the speaker goes quiet instead of after RECORD_SECONDS
+VAD_ENDPOINTING = True
+
+# Keep the microphone open between questions; recordings start TRIGGER_PRE_ROLL
+# seconds before Enter was pressed
+WARM_MICROPHONE = True
+
+# Recordings and photos are kept in memory; set to also write them out for debugging
+SAVE_QUERY_FILES = False
+
+# Keep the camera running between photos; CAMERA_SOURCE picks a source from
+# camera_service.SOURCES ("fake" runs without a camera), None the first available
+WARM_CAMERA = True
+CAMERA_SOURCE = None
+
+# The warm camera shoots a burst and keeps the sharpest, well exposed frame;
+# photos failing frame_quality's thresholds prompt a retake before upload
+BURST_FRAMES = 5
+CHECK_FRAME_QUALITY = True
+
+# Trim silence, remove DC and normalise recorded queries before upload (not
+# possible for live uploads, which leave before the recording is complete);
+# CONDITION_RATE resamples them, None keeps RATE
+CONDITION_AUDIO = True
+CONDITION_RATE = None
 
 class AudioRecorder:
-    def __init__(self):
+    def __init__(self, warm=WARM_MICROPHONE):
         self.CHUNK = 1024
         self.FORMAT = pyaudio.paInt16
         self.CHANNELS = 1
         self.RATE = 16000
         self.RECORD_SECONDS = 5
+        # Voice activity endpointing (VAD_ENDPOINTING)
+        self.MAX_RECORD_SECONDS = 15
+        self.TRAILING_SILENCE = 0.8
+        self.PRE_ROLL = 0.3
+        self.SPEECH_TIMEOUT = 5
+        self.TRIGGER_PRE_ROLL = 0.5
         
         # Ensure directories exist
         self.temp_dir = "temp_files"
         self.audio_dir = "audio"
         os.makedirs(self.temp_dir, exist_ok=True)
         os.makedirs(self.audio_dir, exist_ok=True)
+
+        # Falls back to opening a stream per recording if the microphone cannot be kept open
+        self.capture = None
+        if warm:
+            capture = CaptureService(self.RATE, self.CHANNELS, self.CHUNK)
+            if capture.start():
+                self.capture = capture
+
+    def close(self):
+        """Release the warm microphone"""
+        if self.capture is not None:
+            self.capture.stop()
+            self.capture = None
         
-    def record_audio(self, output_filename):
-        output_path = os.path.join(self.temp_dir, output_filename)
-        
-        p = pyaudio.PyAudio()
-        stream = p.open(format=self.FORMAT,
-                       channels=self.CHANNELS,
-                       rate=self.RATE,
-                       input=True,
-                       frames_per_buffer=self.CHUNK)
-        
+    def frames_to_record(self):
+        """Number of frames record_audio captures, None if the speaker decides"""
+        if VAD_ENDPOINTING:
+            return None
+        return int(self.RATE / self.CHUNK * self.RECORD_SECONDS) * self.CHUNK
+
+    def make_endpointer(self):
+        return Endpointer(self.RATE, pre_roll=self.PRE_ROLL, trailing_silence=self.TRAILING_SILENCE,
+                          max_seconds=self.MAX_RECORD_SECONDS, start_timeout=self.SPEECH_TIMEOUT)
+
+    def open_capture(self):
+        """
+        Pick the capture service a recording reads from
+        Returns:
+            tuple: (CaptureService, start position, whether it was opened just for
+                this recording), or (None, 0, False) if the microphone cannot be opened
+        """
+        if self.capture is not None and self.capture.running:
+            start = self.capture.position() - int(self.TRIGGER_PRE_ROLL * self.RATE)
+            return self.capture, start, False
+        seconds = self.MAX_RECORD_SECONDS if VAD_ENDPOINTING else self.RECORD_SECONDS
+        capture = CaptureService(self.RATE, self.CHANNELS, self.CHUNK, ring_seconds=seconds + 5)
+        if not capture.start():
+            return None, 0, False
+        return capture, 0, True
+
+    @traced("record_audio")
+    def record_audio(self, output_filename=None, upload=None):
+        """
+        Record a query into an in-memory WAV
+
+        With VAD_ENDPOINTING the recording runs from just before the speaker
+        starts until they have been quiet for TRAILING_SILENCE seconds (at
+        most MAX_RECORD_SECONDS); otherwise it lasts RECORD_SECONDS.
+        Args:
+            output_filename: Optional name of a WAV file in temp_dir to also write
+            upload: Optional LiveAudioUpload receiving every kept chunk as it is read
+        Returns:
+            bytes: The WAV recording, or None if no speech was heard
+        """
+        capture, start, cold = self.open_capture()
+        if capture is None:
+            if upload:
+                upload.abort("microphone unavailable")
+            return None
+        before = capture.stats()
+
         print("* recording")
         frames = []
+        endpointer = self.make_endpointer() if VAD_ENDPOINTING else None
+        chunks = capture.chunks(start)
+        # The chunks are views into the capture ring. Joining them below happens
+        # well within a ring's length, but the upload is sent by the event loop
+        # at network speed and may fall a whole ring behind, so it gets copies.
         
-        for i in range(0, int(self.RATE / self.CHUNK * self.RECORD_SECONDS)):
-            data = stream.read(self.CHUNK)
-            frames.append(data)
+        try:
+            if endpointer:
+                for data in chunks:
+                    for kept in endpointer.process(data):
+                        frames.append(kept)
+                        if upload:
+                            upload.write(bytes(kept))
+                    if endpointer.done:
+                        break
+            else:
+                for i, data in zip(range(self.frames_to_record() // self.CHUNK), chunks):
+                    frames.append(data)
+                    if upload:
+                        upload.write(bytes(data))
+        finally:
+            chunks.close()
+            after = capture.stats()
+            if cold:
+                capture.stop()
+            if upload:
+                if frames:
+                    upload.close()
+                else:
+                    upload.abort("no speech detected")
         
         print("* done recording")
-        
-        stream.stop_stream()
-        stream.close()
-        p.terminate()
-        
-        wf = wave.open(output_path, 'wb')
-        wf.setnchannels(self.CHANNELS)
-        wf.setsampwidth(p.get_sample_size(self.FORMAT))
-        wf.setframerate(self.RATE)
-        wf.writeframes(b''.join(frames))
-        wf.close()
-        
-        return output_path
+        lost = {key: after[key] - before[key]
+                for key in ("input_overflows", "dropped_frames", "overruns")}
+        if any(lost.values()):
+            print(f"Capture problems while recording: {lost['input_overflows']} input overflows, "
+                  f"{lost['dropped_frames']} frames dropped, {lost['overruns']} ring overruns")
+
+        if endpointer:
+            print(f"Kept {endpointer.kept_seconds:.1f} s of {endpointer.heard_seconds:.1f} s heard "
+                  f"(VAD {endpointer.analysis_time * 1000:.1f} ms)")
+        if not frames:
+            print("No speech detected")
+            return None
+
+        pcm = b''.join(frames)
+        sampwidth = pyaudio.get_sample_size(self.FORMAT)
+        recording = wav_header(self.RATE, self.CHANNELS, sampwidth,
+                               len(pcm) // (sampwidth * self.CHANNELS)) + pcm
+        if output_filename:
+            with open(os.path.join(self.temp_dir, output_filename), 'wb') as f:
+                f.write(recording)
+        return recording
+
+    def record_and_send(self, send_query):
+        """
+        Record a query and send it, uploading while recording if LIVE_UPLOAD is set
+        Args:
+            send_query: Callable (audio source) sending the query, e.g.
+                APIClient.stream_voice_query; gets WAV bytes or a LiveAudioUpload
+        Returns:
+            Whatever send_query returns
+        """
+        output_filename = "query.wav" if SAVE_QUERY_FILES else None
+        if not LIVE_UPLOAD:
+            recording = self.record_audio(output_filename)
+            if recording is None:
+                return None
+            print("Sending request to server...")
+            return send_query(self.condition(recording))
+
+        upload = LiveAudioUpload(self.RATE, self.CHANNELS, pyaudio.get_sample_size(self.FORMAT),
+                                 nframes=self.frames_to_record())
+        recordings = []
+        def record():
+            recordings.append(self.record_audio(output_filename, upload))
+        # Run in a copy of this context so the recording joins the current trace
+        recorder = threading.Thread(target=contextvars.copy_context().run, args=(record,),
+                                    name="recorder", daemon=True)
+        recorder.start()
+        try:
+            print("Streaming request to server...")
+            answer = send_query(upload)
+        finally:
+            recorder.join()
+
+        # A live request cannot be retried, but nothing was played if no answer
+        # byte arrived, so the complete recording can still go as a normal upload
+        recording = recordings[0] if recordings else None
+        if answer is None and upload.bytes_received == 0 and recording is not None:
+            print("Live upload failed, sending the recording again...")
+            return send_query(self.condition(recording))
+        return answer
+
+    def condition(self, recording):
+        """
+        Condition a recorded query for upload if CONDITION_AUDIO is set
+        Args:
+            recording: WAV bytes from record_audio()
+        Returns:
+            bytes: The conditioned WAV, or the recording unchanged
+        """
+        if not CONDITION_AUDIO:
+            return recording
+        with latency_trace.span("condition_audio"):
+            conditioned, report = condition_wav(recording, target_rate=CONDITION_RATE)
+        if report:
+            print(f"Conditioned query: {describe(report)}")
+            return conditioned
+        return recording
 
 class CameraCapture:
-    def __init__(self):
+    def __init__(self, warm=WARM_CAMERA):
         self.image_dir = 'image/temp'
         os.makedirs(self.image_dir, exist_ok=True)
+
+        # Falls back to running libcamera-still per photo without a warm camera
+        self.service = None
+        if warm:
+            source = make_source(CAMERA_SOURCE)
+            if source is None:
+                print("No camera source for a warm camera, using libcamera-still per photo")
+            else:
+                service = CameraService(source)
+                if service.start():
+                    self.service = service
+
+    def close(self):
+        """Stop the warm camera"""
+        if self.service is not None:
+            self.service.stop()
+            self.service = None
         
     def capture_image(self):
+        """
+        Take a photo, offering a retake while it is too blurry or badly exposed
+        Returns:
+            bytes: The JPEG, or None if capture failed
+        """
+        print("Press Enter to capture an image...")
+        input()
+        while True:
+            image, score = self.shoot()
+            if image is None:
+                return None
+            if not CHECK_FRAME_QUALITY or frame_quality.acceptable(score):
+                return self.captured(image)
+            answer = input(f"The photo looks {frame_quality.problems(score)}. "
+                           "Press Enter to retake, 'k' to use it anyway: ")
+            if answer.lower() == 'k':
+                return self.captured(image)
+
+    def shoot(self):
+        """
+        Take one photo: the best of a burst from the warm camera, or a
+        libcamera-still shot written to a pipe instead of the SD card
+        Returns:
+            tuple: (JPEG bytes, frame_quality score or None), or (None, None) on failure
+        """
         try:
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = os.path.join(self.image_dir, f'capture_{timestamp}.jpg')
-            
-            print("Press Enter to capture an image...")
-            input()
+            if self.service is not None and self.service.running:
+                with latency_trace.span("capture_image", source="warm") as span:
+                    frames = self.service.burst(BURST_FRAMES if CHECK_FRAME_QUALITY else 1)
+                    best, scores = 0, []
+                    if frames and CHECK_FRAME_QUALITY:
+                        best, scores = frame_quality.pick_best([f.raw() for f in frames])
+                        span.set(sharpness=[round(s["sharpness"]) for s in scores], best=best)
+                    image = frames[best].jpeg() if frames else None
+                if image:
+                    for i, score in enumerate(scores):
+                        marker = "*" if i == best else " "
+                        print(f"{marker} frame {i + 1}: {frame_quality.describe(score)}")
+                    return image, scores[best] if scores else None
+                print("Warm camera gave no frame, using libcamera-still")
             
             command = [
                 'libcamera-still',
-                '-o', filename,
+                '-o', '-',
                 '--width', '1920',
                 '--height', '1080',
                 '--immediate'
             ]
             
-            result = subprocess.run(command, capture_output=True, text=True)
+            with latency_trace.span("capture_image", source="libcamera-still"):
+                result = subprocess.run(command, capture_output=True)
             
-            if result.returncode == 0 and os.path.exists(filename):
-                print(f"Image captured and saved as: {filename}")
-                return filename
+            if result.returncode == 0 and result.stdout:
+                score = None
+                if CHECK_FRAME_QUALITY:
+                    score = frame_quality.score_image(result.stdout)
+                    print(f"Photo: {frame_quality.describe(score)}")
+                return result.stdout, score
             else:
                 print("Error capturing image:")
-                print(result.stderr)
-                return None
+                print(result.stderr.decode(errors='replace'))
+                return None, None
                 
         except Exception as e:
             print(f"Error capturing image: {str(e)}")
-            return None
+            return None, None
+
+    def captured(self, image):
+        """Report a captured JPEG, saving it if SAVE_QUERY_FILES is set, and return it"""
+        print(f"Image captured ({len(image) / 1024:.1f} KB)")
+        if SAVE_QUERY_FILES:
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = os.path.join(self.image_dir, f'capture_{timestamp}.jpg')
+            with open(filename, 'wb') as f:
+                f.write(image)
+            print(f"Image saved as: {filename}")
+        return image
 
 class APIClient:
-    def __init__(self, base_url="http://192.168.100.160:3100"):
-        self.base_url = base_url
+    """Blocking client for the server endpoints, a thin wrapper over AsyncAPIClient"""
+    def __init__(self, base_url=DEFAULT_BASE_URL, async_client=None):
+        self.async_client = async_client if async_client is not None else AsyncAPIClient(base_url)
+        self.runner = get_event_loop_thread()
         
-    def get_next_sentence(self, book_id="1735953778384-Atomic habits ( PDFDrive ) shorter.pdf"):
-        api_url = f"{self.base_url}/next-sentence?book_id={book_id}"
-        try:
-            response = requests.post(api_url)
-            if response.status_code == 200:
-                return json.loads(response.text)
-            else:
-                print(f"API call failed: {response.status_code}")
-                return None
-        except Exception as e:
-            print(f"Error occurred: {e}")
-            return None
-    
-    def send_voice_query(self, audio_file):
-        url = f"{self.base_url}/rag-voice-assistant"
+    @property
+    def base_url(self):
+        return self.async_client.base_url
         
-        if not os.path.exists(audio_file):
-            print(f"Audio file not found: {audio_file}")
-            return None
-            
-        files = {'file': ('query.wav', open(audio_file, 'rb'), 'audio/wav')}
+    @traced("get_next_sentence")
+    def get_next_sentence(self, book_id=DEFAULT_BOOK_ID):
+        return self.runner.run(self.async_client.get_next_sentence(book_id))
         
-        try:
-            response = requests.post(url, files=files)
-            if response.status_code == 200:
-                response_path = os.path.join('temp_files', "response.wav")
-                with open(response_path, "wb") as f:
-                    f.write(response.content)
-                return response_path
-            else:
-                print(f"Error: {response.status_code}")
-                return None
-        except Exception as e:
-            print(f"API request failed: {str(e)}")
-            return None
-        finally:
-            for f in files.values():
-                f[1].close()
+    @traced("get_next_sentences")
+    def get_next_sentences(self, count, book_id=DEFAULT_BOOK_ID):
+        """
+        Resolve the next count sentence URLs in one round trip
+        Returns:
+            list: Audio URLs in reading order, empty at the end of the book,
+                or None if the request failed
+        """
+        return self.runner.run(self.async_client.get_next_sentences(count, book_id))
+    
+    @traced("send_voice_query")
+    def send_voice_query(self, audio_file):
+        return self.runner.run(self.async_client.send_voice_query(audio_file))
+
+    @traced("stream_voice_query")
+    def stream_voice_query(self, audio_file):
+        """
+        Send a voice query and play the answer while it is still downloading
+        Args:
+            audio_file: Path to the audio file, WAV bytes or file object, or a
+                LiveAudioUpload still being recorded
+        Returns:
+            str: Path to the saved response audio, or None if request fails
+        """
+        return self._stream_and_play(
+            lambda sink: self.async_client.send_voice_query(audio_file, sink=sink))
 
+    @traced("send_ocr_query")
     def send_ocr_query(self, image_file, audio_file):
-        url = f"{self.base_url}/process-ocr-image-and-audio"
-        
-        if not os.path.exists(image_file) or not os.path.exists(audio_file):
-            print("Image or audio file not found")
-            return None
-            
-        files = {
-            'image': ('image.jpg', open(image_file, 'rb'), 'image/jpeg'),
-            'audio': ('query.wav', open(audio_file, 'rb'), 'audio/wav')
-        }
-        
-        try:
-            response = requests.post(url, files=files)
-            if response.status_code == 200:
-                response_path = os.path.join('temp_files', "ocr_response.wav")
-                with open(response_path, "wb") as f:
-                    f.write(response.content)
-                return response_path
-            else:
-                print(f"Error: {response.status_code}")
-                return None
-        except Exception as e:
-            print(f"API request failed: {str(e)}")
-            return None
-        finally:
-            for f in files.values():
-                f[1].close()
+        return self.runner.run(self.async_client.send_ocr_query(image_file, audio_file))
+
+    @traced("stream_ocr_query")
+    def stream_ocr_query(self, image_file, audio_file):
+        """
+        Send an OCR query and play the answer while it is still downloading
+        Returns:
+            str: Path to the saved response audio, or None if request fails
+        """
+        return self._stream_and_play(
+            lambda sink: self.async_client.send_ocr_query(image_file, audio_file, sink=sink))
                 
+    @traced("process_vision_query")
     def process_vision_query(self, image_file, audio_file):
-        url = f"{self.base_url}/process-text-and-image"
-        
-        if not os.path.exists(image_file) or not os.path.exists(audio_file):
-            print("Image or audio file not found")
-            return None
-            
-        files = {
-            'image': ('image.jpg', open(image_file, 'rb'), 'image/jpeg'),
-            'audio': ('query.wav', open(audio_file, 'rb'), 'audio/wav')
-        }
-        
+        return self.runner.run(self.async_client.process_vision_query(image_file, audio_file))
+
+    @traced("stream_vision_query")
+    def stream_vision_query(self, image_file, audio_file):
+        """
+        Send a vision query and play the answer while it is still downloading
+        Returns:
+            str: Path to the saved response audio, or None if request fails
+        """
+        return self._stream_and_play(
+            lambda sink: self.async_client.process_vision_query(image_file, audio_file, sink=sink))
+
+    def _stream_and_play(self, make_request):
+        """
+        Run a query on the event loop and feed its response chunks to the player
+        Args:
+            make_request: Callable (sink) returning the query coroutine
+        Returns:
+            str: Path to the saved response audio, or None if request fails
+        """
+        buffer = StreamingAudioBuffer()
+        future = self.runner.submit(make_request(buffer.append))
+        future.add_done_callback(lambda f: buffer.finish(
+            None if f.cancelled() or f.exception() is None else f.exception()))
         try:
-            response = requests.post(url, files=files)
-            if response.status_code == 200:
-                response_path = os.path.join('temp_files', "vision_response.wav")
-                with open(response_path, "wb") as f:
-                    f.write(response.content)
-                return response_path
-            else:
-                print(f"Error: {response.status_code}")
-                return None
-        except Exception as e:
-            print(f"API request failed: {str(e)}")
-            return None
-        finally:
-            for f in files.values():
-                f[1].close()
+            play_buffer(buffer)
+            return future.result()
+        except BaseException:
+            future.cancel()
+            raise
+
+    def close(self):
+        """Close the connection pool"""
+        self.runner.run(self.async_client.close())
 
 class AudioPlayer:
+    def __init__(self, cache=None, session=None):
+        self.session = session if session is not None else get_session()
+        self.cache = cache if cache is not None else AudioCache(session=self.session)
+        self.pending_path = os.path.join(self.cache.cache_dir, PENDING_SENTENCES_FILE)
+
     @staticmethod
+    @traced("play_audio")
     def play_audio(filename):
         if not os.path.exists(filename):
             print(f"Audio file not found: {filename}")
             return
             
-        pygame.mixer.init()
-        pygame.mixer.music.load(filename)
-        pygame.mixer.music.play()
-        while pygame.mixer.music.get_busy():
-            pygame.time.Clock().tick(10)
-        pygame.mixer.quit()
+        get_output_engine().play(filename)
 
     @staticmethod
-    def download_and_play_audio(audio_url):
-        try:
-            audio_dir = "audio"
-            os.makedirs(audio_dir, exist_ok=True)
+    def read_continuously(prefetcher, lookahead=2):
+        """
+        Play prefetched sentences back to back until the user presses Enter
+        Args:
+            prefetcher: Running SentencePrefetcher or OfflineBook supplying the clips
+            lookahead: Number of clips handed to the output engine ahead of time
+        """
+        engine = get_output_engine()
+        stop = threading.Event()
+        slots = threading.Semaphore(lookahead)
+        unplayed = []
+        
+        def clip_done(handle, clip):
+            if handle.cancelled:
+                unplayed.append(clip)
+            slots.release()
+        
+        def feed():
+            while not stop.is_set() and not prefetcher.finished:
+                if not slots.acquire(timeout=0.5):
+                    continue
+                clip = prefetcher.next_clip(timeout=0.5)
+                if clip is None:
+                    slots.release()
+                    continue
+                engine.enqueue(clip[1], on_done=lambda handle, clip=clip: clip_done(handle, clip))
+                
+        feeder = threading.Thread(target=feed, name="continuous-reader", daemon=True)
+        feeder.start()
+        input("Reading continuously, press Enter to pause...")
+        stop.set()
+        feeder.join()
+        engine.stop()
+        # The interrupted sentence and the one queued behind it are read again on resume
+        prefetcher.give_back(unplayed)
+
+    def download_audio(self, audio_url, cancel_event=None):
+        """
+        Fetch a sentence clip through the on-disk audio cache
+        Args:
+            audio_url: URL of the audio file
+            cancel_event: Optional threading.Event that aborts the download when set
+        Returns:
+            str: Path to the cached file, or None if the download fails
+        """
+        return self.cache.fetch(audio_url, cancel_event)
+
+    def download_and_play_audio(self, audio_url):
+        """
+        Play a sentence clip, streaming it while it downloads on a cache miss
+        Args:
+            audio_url: URL of the audio file
+        """
+        file_path = self.cache.lookup(audio_url)
+        if file_path:
+            print("Starting playback...")
+            self.play_audio(file_path)
+            print("Playback complete")
+            return
             
+        try:
             print("Starting download...")
-            response = requests.get(audio_url, stream=True)
-            if response.status_code == 200:
-                filename = unquote(audio_url.split('/')[-1].split('?')[0])
-                file_path = os.path.join(audio_dir, filename)
-                
-                with open(file_path, 'wb') as f:
-                    for chunk in response.iter_content(chunk_size=8192):
-                        if chunk:
-                            f.write(chunk)
-                
-                print("Starting playback...")
-                AudioPlayer.play_audio(file_path)
-                print("Playback complete")
-            else:
+            response = self.session.get(audio_url, stream=True,
+                                        timeout=get_policy("audio").requests_timeout())
+            if response.status_code != 200:
                 print(f"Failed to download audio: {response.status_code}")
+                return
                 
+            print("Starting playback...")
+            buffer = play_stream(response.iter_content(chunk_size=8192),
+                                 content_length=content_length_of(response.headers))
+            if buffer and buffer.done and not buffer.error:
+                buffer.seek(0)
+                self.cache.store(audio_url, buffer, response.headers)
+            print("Playback complete")
+            
         except Exception as e:
             print(f"Error during playback: {e}")
 
+def print_resilience_stats():
+    """Print how often timeouts, retries and hedged requests fired per endpoint"""
+    for endpoint, counts in sorted(resilience_stats().items()):
+        print(f"{endpoint}: {counts['calls']} calls, {counts['timeouts']} timeouts, "
+              f"{counts['retries']} retries, {counts['hedges']} hedges "
+              f"({counts['hedge_wins']} won), {counts['failures']} failed")
+
+def offer_repeat(answer_path):
+    """
+    Let the user hear the last answer again, played from disk without asking the server
+    Args:
+        answer_path: Response audio returned by the query, or None if it failed
+    """
+    if not answer_path:
+        return
+    while input("Press 'r' to hear the answer again, Enter to continue: ").lower() == 'r':
+        AudioPlayer.play_audio(answer_path)
+
 def main():
     recorder = AudioRecorder()
     camera = CameraCapture()
@@ -243,69 +574,110 @@ def main():
         print("2. Voice Query Assistant")
         print("3. OCR + Voice Query")
         print("4. Vision + Voice Query")
-        print("5. Exit")
+        print("5. Download Book for Offline Listening")
+        print("6. Exit")
         
-        choice = input("\nChoose option (1-5): ")
+        choice = input("\nChoose option (1-6): ")
         
         if choice == "1":
             print("\n=== Audiobook Player Mode ===")
-            while True:
-                audio_url = api_client.get_next_sentence()
-                if audio_url:
-                    print(f"Received audio URL: {audio_url}")
-                    audio_player.download_and_play_audio(audio_url)
-                user_input = input("Press Enter for next sentence, 'b' to go back to main menu: ")
-                if user_input.lower() == 'b':
-                    break
+            prefetcher = OfflineBook.open(DEFAULT_BOOK_ID)
+            if prefetcher:
+                print("Playing downloaded copy of the book")
+            else:
+                prefetcher = SentencePrefetcher(api_client.get_next_sentence,
+                                                audio_player.download_audio,
+                                                resolve_batch=api_client.get_next_sentences,
+                                                depth=PREFETCH_DEPTH,
+                                                max_bytes=PREFETCH_MAX_BYTES,
+                                                pending=load_pending(audio_player.pending_path,
+                                                                     DEFAULT_BOOK_ID))
+            prefetcher.start()
+            try:
+                while True:
+                    with latency_trace.span("audiobook_sentence"):
+                        with latency_trace.span("next_clip"):
+                            clip = prefetcher.next_clip(timeout=30)
+                        if clip:
+                            audio_url, file_path = clip
+                            print(f"Received audio URL: {audio_url}")
+                            audio_player.play_audio(file_path)
+                            print("Playback complete")
+                        else:
+                            print("No sentence available")
+                    user_input = input("Press Enter for next sentence, 'c' to read continuously, "
+                                       "'b' to go back to main menu: ")
+                    if user_input.lower() == 'c':
+                        audio_player.read_continuously(prefetcher)
+                    elif user_input.lower() == 'b':
+                        break
+            finally:
+                prefetcher.stop()
+                if isinstance(prefetcher, SentencePrefetcher):
+                    save_pending(audio_player.pending_path, DEFAULT_BOOK_ID,
+                                 prefetcher.leftovers())
+                stats = audio_player.cache.stats()
+                print(f"Audio cache: {stats['hits']} hits, {stats['misses']} misses, "
+                      f"{stats['bytes_cached'] / 1024 / 1024:.1f} MB cached")
+                stats = pool_stats()
+                print(f"Connections: {stats['requests']} requests, "
+                      f"{stats['new_connections']} opened, {stats['reused']} reused")
+                print_resilience_stats()
                     
         elif choice == "2":
             print("\n=== Voice Query Mode ===")
             print("Press Enter to start recording...")
             input()
-            audio_path = recorder.record_audio("query.wav")
-            
-            print("Sending request to server...")
-            response_file = api_client.send_voice_query(audio_path)
-            
-            if response_file:
-                print("Playing response...")
-                audio_player.play_audio(response_file)
+            with latency_trace.span("voice_query_mode"):
+                answer = recorder.record_and_send(api_client.stream_voice_query)
+            offer_repeat(answer)
                 
         elif choice == "3":
             print("\n=== OCR + Voice Query Mode ===")
             print("Taking photo...")
-            image_path = camera.capture_image()
+            image = camera.capture_image()
             
-            if image_path:
+            if image:
                 print("Press Enter to start recording...")
                 input()
-                audio_path = recorder.record_audio("query.wav")
-                
-                print("Sending request to server...")
-                response_file = api_client.send_ocr_query(image_path, audio_path)
-                
-                if response_file:
-                    print("Playing response...")
-                    audio_player.play_audio(response_file)
+                send_query = lambda audio: api_client.stream_ocr_query(image, audio)
+                with latency_trace.span("ocr_query_mode"):
+                    answer = recorder.record_and_send(send_query)
+                offer_repeat(answer)
                     
         elif choice == "4":
             print("\n=== Vision + Voice Query Mode ===")
             print("Taking photo...")
-            image_path = camera.capture_image()
+            image = camera.capture_image()
             
-            if image_path:
+            if image:
                 print("Press Enter to start recording...")
                 input()
-                audio_path = recorder.record_audio("query.wav")
-                
-                print("Sending request to server...")
-                response_file = api_client.process_vision_query(image_path, audio_path)
-                
-                if response_file:
-                    print("Playing response...")
-                    audio_player.play_audio(response_file)
+                send_query = lambda audio: api_client.stream_vision_query(image, audio)
+                with latency_trace.span("vision_query_mode"):
+                    answer = recorder.record_and_send(send_query)
+                offer_repeat(answer)
                     
         elif choice == "5":
+            print("\n=== Offline Book Download ===")
+            downloader = BookDownloader(api_client, DEFAULT_BOOK_ID)
+            if downloader.run():
+                print("Book ready for offline listening")
+            else:
+                print("Download incomplete, choose this option again to resume")
+                
+        elif choice == "6":
+            print_resilience_stats()
+            latency_trace.print_summary()
+            api_client.close()
+            if recorder.capture is not None:
+                stats = recorder.capture.stats()
+                print(f"Microphone: {stats['frames'] / recorder.RATE:.0f} s captured, "
+                      f"{stats['input_overflows']} input overflows, "
+                      f"{stats['dropped_frames']} frames dropped, "
+                      f"slowest callback {stats['max_callback_ms']:.2f} ms")
+            recorder.close()
+            camera.close()
             print("\nThank you for using the Unified Client Application!")
             break
             
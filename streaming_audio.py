@@ -0,0 +1,281 @@
+import io
+import struct
+import tempfile
+import threading
+from audio_output import get_output_engine
+from live_upload import wav_header
+import latency_trace
+
+class StreamingAudioBuffer(io.RawIOBase):
+    """
+    File-like byte buffer that can be read while it is still being written
+
+    A download thread appends chunks with append() and calls finish() at the
+    end. Reads past the received data block until more bytes arrive, so the
+    player can read the samples of a WAV file while the rest of it is still
+    downloading. If the total length is known, seeking relative to the end
+    does not have to wait for the last byte.
+
+    Received bytes are kept in a spooled temporary file: the first
+    max_memory bytes stay in RAM, anything beyond goes to disk, so a long
+    answer that downloads faster than it plays does not pile up in memory.
+    """
+    def __init__(self, content_length=None, max_memory=256 * 1024):
+        super().__init__()
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory)
+        self._received = 0
+        self._pos = 0
+        self._done = False
+        self._error = None
+        self._cond = threading.Condition()
+        self.content_length = content_length
+
+    # Writer side
+
+    def append(self, chunk):
+        """Append a chunk received from the network"""
+        with self._cond:
+            self._file.seek(self._received)
+            self._file.write(chunk)
+            self._received += len(chunk)
+            self._cond.notify_all()
+
+    def finish(self, error=None):
+        """Mark the stream complete, optionally with the error that ended it"""
+        with self._cond:
+            self._done = True
+            self._error = error
+            if self.content_length is None or error is None:
+                self.content_length = self._received
+            self._cond.notify_all()
+
+    def wait_for(self, nbytes, timeout=None):
+        """
+        Wait until nbytes have been received or the stream has ended
+        Returns:
+            bool: True if the condition was met before the timeout
+        """
+        with self._cond:
+            return self._cond.wait_for(lambda: self._received >= nbytes or self._done, timeout)
+
+    @property
+    def received(self):
+        return self._received
+
+    @property
+    def done(self):
+        return self._done
+
+    @property
+    def error(self):
+        return self._error
+
+    # Reader side
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._pos
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        with self._cond:
+            if whence == io.SEEK_SET:
+                self._pos = offset
+            elif whence == io.SEEK_CUR:
+                self._pos += offset
+            elif whence == io.SEEK_END:
+                if self.content_length is None:
+                    self._cond.wait_for(lambda: self._done)
+                self._pos = self.content_length + offset
+            else:
+                raise ValueError(f"Invalid whence: {whence}")
+            self._pos = max(0, self._pos)
+            return self._pos
+
+    def readinto(self, b):
+        with self._cond:
+            self._cond.wait_for(lambda: self._received > self._pos or self._done)
+            self._file.seek(self._pos)
+            chunk = self._file.read(max(0, min(len(b), self._received - self._pos)))
+            b[:len(chunk)] = chunk
+            self._pos += len(chunk)
+            return len(chunk)
+
+    def close(self):
+        self._file.close()
+        super().close()
+
+def feed_buffer(buffer, chunks, save_path=None):
+    """
+    Copy chunks into buffer (and optionally a file), then finish the buffer
+    Args:
+        buffer: StreamingAudioBuffer to fill
+        chunks: Iterable of byte chunks, e.g. response.iter_content()
+        save_path: Optional path that receives a copy of the stream
+    """
+    error = None
+    out = open(save_path, 'wb') if save_path else None
+    try:
+        for chunk in chunks:
+            if chunk:
+                buffer.append(chunk)
+                if out:
+                    out.write(chunk)
+    except Exception as e:
+        error = e
+    finally:
+        if out:
+            out.close()
+        buffer.finish(error)
+
+def read_exact(stream, size):
+    """
+    Returns:
+        bytes: The next size bytes of stream, fewer only where the stream ends
+    """
+    data = bytearray()
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            break
+        data.extend(chunk)
+    return bytes(data)
+
+def read_wav_header(stream):
+    """
+    Parse a WAV header up to the first sample
+    Args:
+        stream: Binary stream positioned at the start of the file
+    Returns:
+        tuple: (rate, channels, sampwidth, data_size), data_size None if the
+            header leaves it open, or None if this is not an 8/16-bit PCM WAV file
+    """
+    riff = read_exact(stream, 12)
+    if len(riff) < 12 or riff[:4] != b'RIFF' or riff[8:12] != b'WAVE':
+        return None
+    fmt = None
+    while True:
+        chunk = read_exact(stream, 8)
+        if len(chunk) < 8:
+            return None
+        chunk_id, size = chunk[:4], struct.unpack('<I', chunk[4:])[0]
+        if chunk_id == b'data':
+            if fmt is None:
+                return None
+            # Encoders that stream write 0 or 0xFFFFFFFF when the length is unknown
+            return fmt + (size if 0 < size < 0xFFFFFFFF else None,)
+        body = read_exact(stream, size + size % 2)
+        if chunk_id == b'fmt ':
+            if len(body) < 16:
+                return None
+            tag, channels, rate, _, _, bits = struct.unpack('<HHIIHH', body[:16])
+            # WAVE_FORMAT_EXTENSIBLE keeps the real format tag in its sub-format GUID
+            if tag == 0xFFFE and len(body) >= 26:
+                tag = struct.unpack('<H', body[24:26])[0]
+            if tag != 1 or bits not in (8, 16) or not channels:
+                return None
+            fmt = (rate, channels, bits // 8)
+
+def play_wav_stream(stream, header, engine, chunk_seconds=0.5, lookahead=2):
+    """
+    Queue the samples of a WAV stream on the output engine as they arrive
+
+    Each chunk_seconds of samples becomes a small WAV clip of its own, so
+    playback starts with the first chunk instead of after the last byte,
+    and the engine's gapless queue joins the chunks back together.
+    Args:
+        stream: Binary stream positioned at the first sample, see read_wav_header()
+        header: (rate, channels, sampwidth, data_size) from read_wav_header()
+        engine: AudioOutputEngine playing the chunks
+        chunk_seconds: Length of each queued chunk
+        lookahead: Chunks decoded ahead of the one playing
+    Returns:
+        bool: True if anything was played to the end, False if nothing was or
+            playback was stopped
+    """
+    rate, channels, sampwidth, remaining = header
+    frame_size = channels * sampwidth
+    chunk_size = max(1, int(rate * chunk_seconds)) * frame_size
+    # Reading waits for free slots, so decoded audio stays bounded
+    slots = threading.Semaphore(lookahead + 1)
+    last = None
+    while remaining is None or remaining > 0:
+        pcm = read_exact(stream, chunk_size if remaining is None else min(chunk_size, remaining))
+        pcm = pcm[:len(pcm) - len(pcm) % frame_size]
+        if not pcm:
+            break
+        if remaining is not None:
+            remaining -= len(pcm)
+        slots.acquire()
+        if last is not None and last.cancelled:
+            break
+        last = engine.enqueue(wav_header(rate, channels, sampwidth, len(pcm) // frame_size) + pcm,
+                              on_done=lambda handle: slots.release())
+    if last is None:
+        return False
+    last.wait()
+    return not last.cancelled
+
+def play_buffer(buffer, jitter_bytes=32 * 1024):
+    """
+    Start playback once jitter_bytes have arrived and keep reading as the buffer fills
+    Args:
+        buffer: StreamingAudioBuffer filled by another thread
+        jitter_bytes: Bytes to buffer before playback starts
+    Returns:
+        bool: True if anything was played
+    """
+    with latency_trace.span("jitter_buffer"):
+        buffer.wait_for(jitter_bytes)
+    if buffer.received == 0:
+        print(f"Audio stream failed: {buffer.error}" if buffer.error else "Audio stream was empty")
+        return False
+
+    engine = get_output_engine()
+    with latency_trace.span("playback"):
+        header = read_wav_header(buffer)
+        if header is not None:
+            play_wav_stream(buffer, header, engine)
+        else:
+            # Compressed audio is decoded whole, once the download has finished
+            buffer.seek(0)
+            engine.play(buffer)
+    if buffer.error:
+        print(f"Audio stream ended early: {buffer.error}")
+    return True
+
+def play_stream(chunks, content_length=None, jitter_bytes=32 * 1024, save_path=None):
+    """
+    Download chunks on a feeder thread and play them as they arrive
+    Args:
+        chunks: Iterable of byte chunks, e.g. response.iter_content()
+        content_length: Total size in bytes, if the server announced it
+        jitter_bytes: Bytes to buffer before playback starts
+        save_path: Optional path that receives a copy of the stream
+    Returns:
+        StreamingAudioBuffer: The filled buffer, or None if nothing could be played
+    """
+    buffer = StreamingAudioBuffer(content_length)
+    feeder = threading.Thread(target=feed_buffer, args=(buffer, chunks, save_path),
+                              name="audio-stream-feeder", daemon=True)
+    feeder.start()
+    played = play_buffer(buffer, jitter_bytes)
+    feeder.join()
+    return buffer if played else None
+
+def content_length_of(headers):
+    """
+    Returns:
+        int: Body size announced in the response headers, or None if unknown
+    """
+    # A compressed body decodes to a different length than announced
+    if headers.get('Content-Encoding') or not headers.get('Content-Length'):
+        return None
+    try:
+        return int(headers['Content-Length'])
+    except ValueError:
+        return None
@@ -0,0 +1,354 @@
+"""
+Local stand-in for the RAG reader server
+
+Serves the audiobook and query endpoints with generated audio so the
+client can be exercised and benchmarked without the real server. Query
+uploads may arrive with a chunked body; the server records when each one
+finished and whether its audio was a ramp received in order. Latency,
+upload and download bandwidth, clip and answer sizes, and a slow or
+failing tail of requests are all configurable. Run it directly:
+
+    python stub_server.py --port 3100 --latency 0.05 --download-bandwidth 256
+
+and point APIClient at http://127.0.0.1:3100, or start it in-process
+with StubServer(...).start().
+"""
+import io
+import json
+import math
+import wave
+import time
+import array
+import random
+import argparse
+import threading
+from email.parser import BytesParser
+from email.policy import HTTP
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote, unquote
+
+def make_wav(seconds, rate=16000, frequency=440.0):
+    """
+    Generate a mono 16-bit sine tone
+    Returns:
+        bytes: Complete WAV file
+    """
+    frames = int(seconds * rate)
+    samples = array.array('h', (int(8000 * math.sin(2 * math.pi * frequency * i / rate))
+                                for i in range(frames)))
+    out = io.BytesIO()
+    wf = wave.open(out, 'wb')
+    wf.setnchannels(1)
+    wf.setsampwidth(2)
+    wf.setframerate(rate)
+    wf.writeframes(samples.tobytes())
+    wf.close()
+    return out.getvalue()
+
+def make_ramp(start, count):
+    """
+    Generate count 16-bit samples counting up from start
+
+    Uploaded audio built from consecutive ramps lets the server check that
+    no chunk was dropped, duplicated or reordered.
+    Returns:
+        bytes: Little-endian PCM samples
+    """
+    return array.array('h', ((start + i) & 0x7FFF for i in range(count))).tobytes()
+
+def ramp_in_order(wav_bytes):
+    """
+    Returns:
+        bool: True if wav_bytes holds one unbroken ramp from sample 0
+    """
+    try:
+        wf = wave.open(io.BytesIO(wav_bytes), 'rb')
+        pcm = wf.readframes(wf.getnframes())
+        wf.close()
+    except (wave.Error, EOFError):
+        return False
+    return bool(pcm) and pcm == make_ramp(0, len(pcm) // 2)
+
+QUERY_ENDPOINTS = ('/rag-voice-assistant', '/process-ocr-image-and-audio', '/process-text-and-image')
+
+class StubState:
+    """Reading positions and settings shared by all request handlers"""
+    def __init__(self, sentences=200, latency=0.0, batch=True, clip_seconds=2.0,
+                 answer_seconds=2.0, bandwidth=None, slow_ratio=0.0, slow_latency=1.0,
+                 error_ratio=0.0, seed=None, download_bandwidth=None):
+        self.sentences = sentences
+        self.latency = latency
+        self.batch = batch
+        self.clip = make_wav(clip_seconds)
+        self.answer = make_wav(answer_seconds, frequency=660.0)
+        # Request body bytes per second read from the client, None for unlimited
+        self.bandwidth = bandwidth
+        # Response bytes per second written to the client, None for unlimited
+        self.download_bandwidth = download_bandwidth
+        # Tail behaviour: a fraction of requests stall or fail like a bad replica
+        self.slow_ratio = slow_ratio
+        self.slow_latency = slow_latency
+        self.error_ratio = error_ratio
+        self.random = random.Random(seed)
+        self.cursors = {}
+        self.requests = {}
+        # One dict per query upload: path, bytes, chunked, in_order, received_at
+        self.uploads = []
+        self.lock = threading.Lock()
+
+    def count(self, path):
+        with self.lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def advance(self, book_id, count):
+        """Return the next count sentence indexes for book_id"""
+        with self.lock:
+            start = self.cursors.get(book_id, 0)
+            end = min(start + count, self.sentences)
+            self.cursors[book_id] = end
+            return list(range(start, end))
+
+    def wait(self):
+        """
+        Sleep for the request latency, sometimes stalling
+        Returns:
+            bool: True if this request should fail with a 503
+        """
+        with self.lock:
+            slow = self.random.random() < self.slow_ratio
+            fail = self.random.random() < self.error_ratio
+        time.sleep(self.latency + (self.slow_latency if slow else 0.0))
+        return fail
+
+    def record_upload(self, upload):
+        with self.lock:
+            self.uploads.append(upload)
+
+    def reset(self):
+        with self.lock:
+            self.cursors.clear()
+            self.requests.clear()
+            self.uploads.clear()
+
+class StubRequestHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    @property
+    def state(self):
+        return self.server.state
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle(self):
+        try:
+            super().handle()
+        except (ConnectionResetError, BrokenPipeError):
+            # Clients closing kept-alive connections is routine here
+            pass
+
+    def do_POST(self):
+        url = urlparse(self.path)
+        query = parse_qs(url.query)
+        self.state.count(url.path)
+        if url.path in QUERY_ENDPOINTS:
+            self._handle_query(url.path)
+            return
+        self._discard_body()
+        if self.state.wait():
+            self._send(503, b'Unavailable', 'text/plain')
+            return
+
+        book_id = query.get('book_id', ['book'])[0]
+        if url.path == '/next-sentence':
+            indexes = self.state.advance(book_id, 1)
+            self._send_json(self._audio_url(book_id, indexes[0]) if indexes else None)
+        elif url.path == '/next-sentences' and self.state.batch:
+            count = int(query.get('count', ['1'])[0])
+            indexes = self.state.advance(book_id, count)
+            self._send_json([self._audio_url(book_id, i) for i in indexes])
+        else:
+            self._send(404, b'Not found', 'text/plain')
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        self.state.count(url.path)
+        if self.state.wait():
+            self._send(503, b'Unavailable', 'text/plain')
+            return
+
+        if url.path.startswith('/audio/'):
+            etag = f'"{len(self.state.clip)}-{unquote(url.path)}"'
+            if self.headers.get('If-None-Match') == etag:
+                self._send(304, b'', 'audio/wav', {'ETag': etag})
+            else:
+                self._send(200, self.state.clip, 'audio/wav', {'ETag': etag})
+        else:
+            self._send(404, b'Not found', 'text/plain')
+
+    def _handle_query(self, path):
+        chunked = self.headers.get('Transfer-Encoding', '').lower() == 'chunked'
+        body = self._read_body()
+        received_at = time.perf_counter()
+
+        audio = None
+        message = BytesParser(policy=HTTP).parsebytes(
+            b'Content-Type: ' + self.headers.get('Content-Type', '').encode('latin-1') + b'\r\n\r\n' + body)
+        if message.is_multipart():
+            for part in message.iter_parts():
+                if part.get_param('name', header='content-disposition') in ('file', 'audio'):
+                    audio = part.get_payload(decode=True)
+        if audio is None:
+            self._send(400, b'No audio field', 'text/plain')
+            return
+
+        self.state.record_upload({
+            "path": path,
+            "bytes": len(body),
+            "chunked": chunked,
+            "in_order": ramp_in_order(audio),
+            "received_at": received_at,
+        })
+        if self.state.wait():
+            self._send(503, b'Unavailable', 'text/plain')
+            return
+        self._send(200, self.state.answer, 'audio/wav')
+
+    def _read_body(self):
+        """Read the request body, de-chunking it and applying the bandwidth limit"""
+        if self.headers.get('Transfer-Encoding', '').lower() == 'chunked':
+            body = bytearray()
+            while True:
+                size = int(self.rfile.readline().split(b';')[0].strip() or b'0', 16)
+                if size == 0:
+                    # Skip trailers up to the blank line
+                    while self.rfile.readline() not in (b'\r\n', b'\n', b''):
+                        pass
+                    return bytes(body)
+                body.extend(self._read_throttled(size))
+                self.rfile.readline()
+        return self._read_throttled(int(self.headers.get('Content-Length') or 0))
+
+    def _read_throttled(self, length):
+        bandwidth = self.state.bandwidth
+        if not bandwidth:
+            return self.rfile.read(length)
+        data = bytearray()
+        step = max(1024, int(bandwidth / 50))
+        while len(data) < length:
+            piece = self.rfile.read(min(step, length - len(data)))
+            if not piece:
+                break
+            data.extend(piece)
+            time.sleep(len(piece) / bandwidth)
+        return bytes(data)
+
+    def _audio_url(self, book_id, index):
+        host, port = self.server.server_address[:2]
+        return f"http://{host}:{port}/audio/{quote(book_id)}/{index:05d}.wav"
+
+    def _discard_body(self):
+        self._read_body()
+
+    def _send_json(self, payload):
+        self._send(200, json.dumps(payload).encode('utf-8'), 'application/json')
+
+    def _send(self, status, body, content_type, headers=None):
+        self.send_response(status)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        if body and self.command != 'HEAD':
+            self._write_throttled(body)
+
+    def _write_throttled(self, body):
+        bandwidth = self.state.download_bandwidth
+        if not bandwidth:
+            self.wfile.write(body)
+            return
+        step = max(1024, int(bandwidth / 50))
+        for offset in range(0, len(body), step):
+            piece = body[offset:offset + step]
+            self.wfile.write(piece)
+            self.wfile.flush()
+            time.sleep(len(piece) / bandwidth)
+
+class StubServer:
+    """Run the stub server on a background thread"""
+    def __init__(self, host="127.0.0.1", port=0, **settings):
+        """
+        Args:
+            host: Interface to listen on
+            port: Port to listen on, 0 picks a free one
+            settings: StubState options (sentences, latency, batch, clip_seconds,
+                answer_seconds, bandwidth, download_bandwidth, slow_ratio, slow_latency,
+                error_ratio, seed)
+        """
+        self.httpd = ThreadingHTTPServer((host, port), StubRequestHandler)
+        self.httpd.daemon_threads = True
+        self.httpd.state = StubState(**settings)
+        self._thread = None
+
+    @property
+    def state(self):
+        return self.httpd.state
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="stub-server",
+                                        daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the RAG reader server")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=3100)
+    parser.add_argument('--latency', type=float, default=0.0, help="Seconds added to every request")
+    parser.add_argument('--sentences', type=int, default=200, help="Sentences per book")
+    parser.add_argument('--clip-seconds', type=float, default=2.0, help="Length of each sentence clip")
+    parser.add_argument('--answer-seconds', type=float, default=2.0, help="Length of query answers")
+    parser.add_argument('--bandwidth', type=float, default=None,
+                        help="Upload bandwidth limit in KB/s")
+    parser.add_argument('--download-bandwidth', type=float, default=None,
+                        help="Download bandwidth limit in KB/s")
+    parser.add_argument('--slow-ratio', type=float, default=0.0,
+                        help="Fraction of requests delayed by --slow-latency")
+    parser.add_argument('--slow-latency', type=float, default=1.0, help="Extra delay of slow requests")
+    parser.add_argument('--error-ratio', type=float, default=0.0,
+                        help="Fraction of requests answered with 503")
+    parser.add_argument('--no-batch', action='store_true', help="Disable /next-sentences")
+    args = parser.parse_args()
+
+    server = StubServer(args.host, args.port, sentences=args.sentences, latency=args.latency,
+                        batch=not args.no_batch, clip_seconds=args.clip_seconds,
+                        answer_seconds=args.answer_seconds,
+                        bandwidth=args.bandwidth * 1024 if args.bandwidth else None,
+                        download_bandwidth=(args.download_bandwidth * 1024
+                                            if args.download_bandwidth else None),
+                        slow_ratio=args.slow_ratio, slow_latency=args.slow_latency,
+                        error_ratio=args.error_ratio)
+    print(f"Stub server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStub server stopped")
+    finally:
+        server.httpd.server_close()
+
+if __name__ == "__main__":
+    main()
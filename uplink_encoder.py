@@ -0,0 +1,143 @@
+"""
+Uplink audio encoders
+
+Recorded queries are 16 kHz mono 16-bit WAV, which is what the server
+expects. Endpoints of a server that also accepts compressed audio can be
+switched to another codec (AsyncAPIClient's uplink_codecs) to shrink the
+request. FLAC is lossless and uses the optional soundfile package or the
+flac / ffmpeg command line tools. Opus is lossy and needs ffmpeg.
+Endpoints fall back to WAV when the chosen encoder is not available, and
+AsyncAPIClient switches an endpoint back to WAV when the server rejects
+the codec. Compare the encoders on a recording:
+
+    python uplink_encoder.py temp_files/query.wav
+"""
+import io
+import sys
+import time
+import shutil
+import subprocess
+
+try:
+    import soundfile
+except ImportError:
+    soundfile = None
+
+class WavEncoder:
+    """Upload the recording unchanged"""
+    name = "wav"
+    extension = ".wav"
+    content_type = "audio/wav"
+
+    def available(self):
+        return True
+
+    def encode(self, wav_bytes):
+        return wav_bytes
+
+class FlacEncoder:
+    """Lossless FLAC, roughly half the size of speech PCM"""
+    name = "flac"
+    extension = ".flac"
+    content_type = "audio/flac"
+
+    def available(self):
+        return bool(soundfile is not None or shutil.which("flac") or shutil.which("ffmpeg"))
+
+    def encode(self, wav_bytes):
+        if soundfile is not None:
+            data, rate = soundfile.read(io.BytesIO(wav_bytes), dtype='int16')
+            out = io.BytesIO()
+            soundfile.write(out, data, rate, format='FLAC', subtype='PCM_16')
+            return out.getvalue()
+        if shutil.which("flac"):
+            return _run_filter(["flac", "--silent", "--best", "--stdout", "-"], wav_bytes)
+        return _run_filter(["ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+                            "-c:a", "flac", "-f", "flac", "pipe:1"], wav_bytes)
+
+class OpusEncoder:
+    """Lossy Opus in Ogg at a speech bitrate, much smaller than FLAC"""
+    name = "opus"
+    extension = ".ogg"
+    content_type = "audio/ogg"
+
+    def __init__(self, bitrate="24k"):
+        self.bitrate = bitrate
+
+    def available(self):
+        return bool(shutil.which("ffmpeg"))
+
+    def encode(self, wav_bytes):
+        return _run_filter(["ffmpeg", "-loglevel", "error", "-i", "pipe:0",
+                            "-c:a", "libopus", "-b:a", self.bitrate, "-application", "voip",
+                            "-f", "ogg", "pipe:1"], wav_bytes)
+
+def _run_filter(command, data):
+    result = subprocess.run(command, input=data, capture_output=True)
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode(errors='replace').strip() or f"{command[0]} failed")
+    return result.stdout
+
+ENCODERS = {
+    "wav": WavEncoder(),
+    "flac": FlacEncoder(),
+    "opus": OpusEncoder(),
+}
+
+# Codec used for the query audio of each endpoint; "flac" or "opus" only
+# for servers known to accept them
+DEFAULT_UPLINK_CODECS = {
+    "/rag-voice-assistant": "wav",
+    "/process-ocr-image-and-audio": "wav",
+    "/process-text-and-image": "wav",
+}
+
+# Statuses with which a server turns down an upload format it does not take
+UNSUPPORTED_CODEC_STATUSES = (400, 415)
+
+def get_encoder(name):
+    """
+    Returns:
+        Encoder named name, or the WAV encoder if it is unknown or unavailable
+    """
+    encoder = ENCODERS.get(name)
+    if encoder is None or not encoder.available():
+        return ENCODERS["wav"]
+    return encoder
+
+def encode_upload(wav_bytes, codec):
+    """
+    Encode a WAV recording for upload, falling back to WAV on any failure
+    Args:
+        wav_bytes: Complete WAV file
+        codec: Name of the encoder to try
+    Returns:
+        tuple: (encoded bytes, encoder used)
+    """
+    encoder = get_encoder(codec)
+    try:
+        return encoder.encode(wav_bytes), encoder
+    except Exception as e:
+        print(f"{encoder.name} encoding failed, sending WAV: {e}")
+        return wav_bytes, ENCODERS["wav"]
+
+def main():
+    if len(sys.argv) != 2:
+        print("Usage: python uplink_encoder.py <recording.wav>")
+        return
+    with open(sys.argv[1], 'rb') as f:
+        wav_bytes = f.read()
+
+    print(f"{'codec':<6} {'bytes':>9} {'saved':>7} {'encode ms':>10}")
+    for name, encoder in ENCODERS.items():
+        if not encoder.available():
+            print(f"{name:<6} not available")
+            continue
+        start = time.perf_counter()
+        encoded = encoder.encode(wav_bytes)
+        elapsed = (time.perf_counter() - start) * 1000
+        saved = 1 - len(encoded) / len(wav_bytes)
+        print(f"{name:<6} {len(encoded):>9} {saved:>6.0%} {elapsed:>10.1f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+"""
+Voice activity detection for endpointing query recordings
+
+Instead of recording a fixed number of seconds, the recorder feeds every
+microphone chunk to an Endpointer. Each chunk is split into short frames
+whose RMS energy and zero-crossing rate are computed in one vectorised
+pass. Recording starts with the first run of speech frames (plus a short
+pre-roll so the first syllable is not clipped) and stops once the speaker
+has been silent for trailing_silence seconds, or at max_seconds.
+
+The energy threshold follows the background noise: the noise floor drops
+at once to the quietest frames heard and creeps up slowly, so it tracks
+a changing room without learning the speech itself, and speech must be
+threshold_ratio times louder than it. Quiet fricatives ("s", "f") are
+still counted as speech through their high zero-crossing rate.
+Input is 16-bit mono PCM, as AudioRecorder records it.
+"""
+import math
+import time
+from collections import deque
+import numpy as np
+
+# dBFS of the quietest sound ever treated as speech, whatever the noise floor
+MIN_SPEECH_DBFS = -50.0
+# Fastest rise of the noise floor estimate, in dB per second
+NOISE_RISE_DB = 3.0
+
+def frame_features(samples, frame_len):
+    """
+    RMS level and zero-crossing rate of consecutive frames
+    Args:
+        samples: 1-D NumPy array in int16 scale; trailing samples short of a frame are ignored
+        frame_len: Samples per frame
+    Returns:
+        tuple: (level in dBFS, zero crossings per sample) arrays, one value per frame
+    """
+    nframes = len(samples) // frame_len
+    frames = samples[:nframes * frame_len].reshape(nframes, frame_len).astype(np.float32)
+    frames /= 32768.0
+    rms = np.sqrt(np.mean(frames * frames, axis=1))
+    level = 20.0 * np.log10(np.maximum(rms, 1e-6))
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / float(frame_len - 1)
+    return level, zcr
+
+class Endpointer:
+    """
+    Decides which microphone chunks belong to the spoken query
+
+    Call process() with every chunk read from the microphone; it returns
+    the chunks to keep (the pre-roll is released all at once when speech
+    starts) and done becomes True when recording should stop.
+    """
+    def __init__(self, rate=16000, frame_ms=20, pre_roll=0.3, trailing_silence=0.8,
+                 max_seconds=15.0, start_timeout=5.0, min_speech=0.1, threshold_ratio=3.0,
+                 fricative_zcr=0.3):
+        """
+        Args:
+            rate: Sample rate in Hz of the mono 16-bit input
+            frame_ms: Length of one analysis frame in milliseconds
+            pre_roll: Seconds of audio kept from before speech was detected
+            trailing_silence: Seconds of silence that end the query
+            max_seconds: Hard limit on the length of the kept recording
+            start_timeout: Seconds to wait for speech before giving up
+            min_speech: Seconds of consecutive speech frames needed to start,
+                so clicks and bumps do not trigger recording
+            threshold_ratio: How much louder than the noise floor speech must be
+            fricative_zcr: Zero-crossing rate from which a frame up to 6 dB below
+                the threshold still counts as (unvoiced) speech
+        """
+        self.rate = rate
+        self.frame_len = max(2, int(rate * frame_ms / 1000))
+        self.frame_seconds = self.frame_len / float(rate)
+        self.pre_roll = pre_roll
+        self.trailing_silence = trailing_silence
+        self.max_seconds = max_seconds
+        self.start_timeout = start_timeout
+        self.threshold_db = 20.0 * math.log10(threshold_ratio)
+        self.fricative_zcr = fricative_zcr
+        self.start_frames = max(1, int(round(min_speech / self.frame_seconds)))
+        self.silence_frames = max(1, int(round(trailing_silence / self.frame_seconds)))
+
+        self.noise_db = None
+        self.started = False
+        self.done = False
+        self.speech_seconds = 0.0
+        self.kept_seconds = 0.0
+        self.heard_seconds = 0.0
+        self.analysis_time = 0.0
+
+        self._leftover = np.zeros(0, dtype=np.int16)
+        self._pre_roll = deque()
+        self._pre_roll_bytes = 0
+        self._pre_roll_max = int(pre_roll * rate) * 2
+        self._speech_run = 0
+        self._silence_run = 0
+
+    def is_speech(self, level, zcr):
+        """
+        Returns:
+            numpy.ndarray: Boolean per frame, True for speech
+        """
+        threshold = MIN_SPEECH_DBFS
+        if self.noise_db is not None:
+            threshold = max(threshold, self.noise_db + self.threshold_db)
+        fricative = (level >= threshold - 6.0) & (zcr >= self.fricative_zcr)
+        return (level >= threshold) | fricative
+
+    def process(self, chunk):
+        """
+        Analyse one chunk of 16-bit mono PCM
+        Args:
+            chunk: Bytes read from the microphone
+        Returns:
+            list: Chunks to append to the recording, possibly empty
+        """
+        if self.done:
+            return []
+        begin = time.perf_counter()
+        samples = np.frombuffer(chunk, dtype=np.int16)
+        chunk_seconds = len(samples) / float(self.rate)
+        self.heard_seconds += chunk_seconds
+        samples = np.concatenate((self._leftover, samples))
+        usable = len(samples) // self.frame_len * self.frame_len
+        self._leftover = samples[usable:]
+        level, zcr = frame_features(samples[:usable], self.frame_len)
+        if len(level):
+            quiet = float(level.min())
+            if self.noise_db is None or quiet < self.noise_db:
+                self.noise_db = quiet
+            else:
+                self.noise_db += min(quiet - self.noise_db, NOISE_RISE_DB * chunk_seconds)
+        speech = self.is_speech(level, zcr)
+        self.speech_seconds += np.count_nonzero(speech) * self.frame_seconds
+
+        keep = []
+        if not self.started:
+            self._pre_roll.append(chunk)
+            self._pre_roll_bytes += len(chunk)
+            # Keep the newest chunks covering at least pre_roll seconds
+            while self._pre_roll_bytes - len(self._pre_roll[0]) >= self._pre_roll_max:
+                self._pre_roll_bytes -= len(self._pre_roll.popleft())
+            for is_speech in speech:
+                self._speech_run = self._speech_run + 1 if is_speech else 0
+                if self._speech_run >= self.start_frames:
+                    self.started = True
+                    break
+            if self.started:
+                keep = list(self._pre_roll)
+                self._pre_roll.clear()
+                self._pre_roll_bytes = 0
+                # Silence already inside the triggering chunk still counts
+                self._silence_run = _trailing_run(~speech)
+            elif self.heard_seconds >= self.start_timeout:
+                self.done = True
+        else:
+            keep = [chunk]
+            if speech.any():
+                self._silence_run = _trailing_run(~speech)
+            else:
+                self._silence_run += len(speech)
+            if self._silence_run >= self.silence_frames:
+                self.done = True
+
+        for kept in keep:
+            self.kept_seconds += len(kept) / 2.0 / self.rate
+        if self.kept_seconds >= self.max_seconds:
+            self.done = True
+        self.analysis_time += time.perf_counter() - begin
+        return keep
+
+def _trailing_run(flags):
+    """Number of consecutive True values at the end of a boolean array"""
+    if len(flags) == 0 or not flags[-1]:
+        return 0
+    falses = np.flatnonzero(~flags)
+    return len(flags) if len(falses) == 0 else len(flags) - 1 - int(falses[-1])
@@ -3,8 +3,8 @@ import pyaudio
 import wave
 import subprocess
 from datetime import datetime
-import requests
-import pygame
+from async_api_client import AsyncAPIClient, get_event_loop_thread
+from audio_output import get_output_engine
 import time
 
 class AudioRecorder:
@@ -111,15 +111,13 @@ def play_audio(filename):
         print(f"Audio file not found: {filename}")
         return
         
-    pygame.mixer.init()
-    pygame.mixer.music.load(filename)
-    pygame.mixer.music.play()
-    while pygame.mixer.music.get_busy():
-        pygame.time.Clock().tick(10)
+    get_output_engine().play(filename)
 
 class VisionAPIClient:
-    def __init__(self, base_url="http://192.168.100.160:3100"):
-        self.base_url = base_url
+    """Blocking client for the vision endpoint, a thin wrapper over AsyncAPIClient"""
+    def __init__(self, base_url="http://192.168.100.160:3100", async_client=None):
+        self.async_client = async_client if async_client is not None else AsyncAPIClient(base_url)
+        self.runner = get_event_loop_thread()
         
     def process_image_and_query(self, image_path, audio_path):
         """
@@ -130,39 +128,12 @@ class VisionAPIClient:
         Returns:
             str: Path to response audio file, or None if request fails
         """
-        if not os.path.exists(image_path):
-            print(f"Image file not found: {image_path}")
-            return None
-        if not os.path.exists(audio_path):
-            print(f"Audio file not found: {audio_path}")
-            return None
+        print("Sending request to server...")
+        return self.runner.run(self.async_client.process_vision_query(image_path, audio_path))
 
-        url = f"{self.base_url}/process-text-and-image"
-        
-        try:
-            with open(image_path, 'rb') as img_file, open(audio_path, 'rb') as audio_file:
-                files = {
-                    'image': ('image.jpg', img_file, 'image/jpeg'),
-                    'audio': ('query.wav', audio_file, 'audio/wav')
-                }
-                
-                print("Sending request to server...")
-                response = requests.post(url, files=files)
-                
-                if response.status_code == 200:
-                    # Save response audio
-                    response_path = os.path.join('temp_files', "vision_response.wav")
-                    with open(response_path, "wb") as f:
-                        f.write(response.content)
-                    return response_path
-                else:
-                    print(f"Error: {response.status_code}")
-                    print(f"Response: {response.text}")
-                    return None
-                    
-        except Exception as e:
-            print(f"API request failed: {str(e)}")
-            return None
+    def close(self):
+        """Close the connection pool"""
+        self.runner.run(self.async_client.close())
 
 def main():
     # Initialize components
@@ -199,6 +170,7 @@ def main():
                 print("Failed to capture image!")
                 
         elif choice == "2":
+            api_client.close()
             break
             
     print("Program ended")
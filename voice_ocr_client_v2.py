@@ -1,9 +1,9 @@
 import os
 import azure.cognitiveservices.speech as speechsdk
-import requests
+from async_api_client import AsyncAPIClient, get_event_loop_thread
 import pyaudio
 import wave
-import pygame
+from audio_output import get_output_engine
 import subprocess
 from datetime import datetime
 import time
@@ -115,15 +115,13 @@ def play_audio(filename):
         print(f"Audio file not found: {filename}")
         return
         
-    pygame.mixer.init()
-    pygame.mixer.music.load(filename)
-    pygame.mixer.music.play()
-    while pygame.mixer.music.get_busy():
-        pygame.time.Clock().tick(10)
+    get_output_engine().play(filename)
 
 class APIClient:
-    def __init__(self, base_url="http://192.168.100.160:3100"):
-        self.base_url = base_url
+    """Blocking client for the server endpoints, a thin wrapper over AsyncAPIClient"""
+    def __init__(self, base_url="http://192.168.100.160:3100", async_client=None):
+        self.async_client = async_client if async_client is not None else AsyncAPIClient(base_url)
+        self.runner = get_event_loop_thread()
         
     def send_voice_query(self, audio_file):
         """
@@ -133,31 +131,7 @@ class APIClient:
         Returns:
             str: Path to response audio file, or None if request fails
         """
-        url = f"{self.base_url}/rag-voice-assistant"
-        
-        if not os.path.exists(audio_file):
-            print(f"Audio file not found: {audio_file}")
-            return None
-            
-        files = {'file': ('query.wav', open(audio_file, 'rb'), 'audio/wav')}
-        
-        try:
-            response = requests.post(url, files=files)
-            if response.status_code == 200:
-                # Save response audio
-                response_path = os.path.join('temp_files', "response.wav")
-                with open(response_path, "wb") as f:
-                    f.write(response.content)
-                return response_path
-            else:
-                print(f"Error: {response.status_code}")
-                return None
-        except Exception as e:
-            print(f"API request failed: {str(e)}")
-            return None
-        finally:
-            for f in files.values():
-                f[1].close()
+        return self.runner.run(self.async_client.send_voice_query(audio_file))
 
     def send_ocr_query(self, image_file, audio_file):
         """
@@ -168,38 +142,11 @@ class APIClient:
         Returns:
             str: Path to response audio file, or None if request fails
         """
-        url = f"{self.base_url}/process-ocr-image-and-audio"
-        
-        # Check if files exist
-        if not os.path.exists(image_file):
-            print(f"Image file not found: {image_file}")
-            return None
-        if not os.path.exists(audio_file):
-            print(f"Audio file not found: {audio_file}")
-            return None
-            
-        files = {
-            'image': ('image.jpg', open(image_file, 'rb'), 'image/jpeg'),
-            'audio': ('query.wav', open(audio_file, 'rb'), 'audio/wav')
-        }
-        
-        try:
-            response = requests.post(url, files=files)
-            if response.status_code == 200:
-                # Save response audio
-                response_path = os.path.join('temp_files', "ocr_response.wav")
-                with open(response_path, "wb") as f:
-                    f.write(response.content)
-                return response_path
-            else:
-                print(f"Error: {response.status_code}")
-                return None
-        except Exception as e:
-            print(f"API request failed: {str(e)}")
-            return None
-        finally:
-            for f in files.values():
-                f[1].close()
+        return self.runner.run(self.async_client.send_ocr_query(image_file, audio_file))
+
+    def close(self):
+        """Close the connection pool"""
+        self.runner.run(self.async_client.close())
 
 def main():
     # Initialize components
@@ -246,6 +193,7 @@ def main():
                 print("Failed to capture image!")
                 
         elif choice == "3":
+            api_client.close()
             break
             
     print("Program ended")